@@ -0,0 +1,133 @@
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only without the brotli package
+    brotli = None
+
+# Bodies smaller than this are sent as is; compression wouldn't pay for itself
+COMPRESSION_MINIMUM_SIZE = int(os.getenv('COMPRESSION_MINIMUM_SIZE', '1000'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+# Brotli quality 4 compresses better than gzip -6 at similar speed; 11 is for static assets
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+
+# Already compressed (or streamed to the browser as events); recompressing only costs CPU
+EXCLUDED_CONTENT_TYPES = ('audio/', 'video/', 'image/', 'application/x-tar', 'application/zip',
+                          'text/event-stream')
+
+
+class _GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        # Sync flush so each streamed chunk reaches the client without waiting for the next
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b''):
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class _BrotliEncoder:
+    name = 'br'
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data=b''):
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """Brotli or gzip response compression, by the client's Accept-Encoding
+
+    Brotli is preferred when the brotli package is installed. Responses under
+    minimum_size, audio and other already-compressed types are sent unchanged.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+        if brotli is not None and 'br' in accepted:
+            encoder_class = _BrotliEncoder
+        elif 'gzip' in accepted:
+            encoder_class = _GzipEncoder
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message['type'] == 'http.response.start':
+                # Held back until the first body chunk shows whether to compress
+                start_message = message
+                headers = Headers(raw=message['headers'])
+                passthrough = ('content-encoding' in headers or
+                               headers.get('content-type', '').startswith(EXCLUDED_CONTENT_TYPES))
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if start_message is not None:
+                if passthrough or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start_message)
+                else:
+                    encoder = encoder_class()
+                    headers = MutableHeaders(raw=start_message['headers'])
+                    headers['Content-Encoding'] = encoder.name
+                    headers.add_vary_header('Accept-Encoding')
+                    if more_body:
+                        del headers['Content-Length']
+                    else:
+                        body = encoder.finish(body)
+                        headers['Content-Length'] = str(len(body))
+                        message = {**message, 'body': body}
+                    await send(start_message)
+                    if not more_body:
+                        await send(message)
+                        return
+                start_message = None
+
+            if passthrough:
+                await send(message)
+            else:
+                data = encoder.chunk(body) if more_body else encoder.finish(body)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
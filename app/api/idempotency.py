@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import os
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How long a completed result is replayed for duplicates of the same key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+# How long a key stays claimed by a pipeline that never finishes (e.g. a crashed worker)
+IDEMPOTENCY_PENDING_SECONDS = int(os.getenv('IDEMPOTENCY_PENDING_SECONDS', '300'))
+# Poll interval while waiting on a duplicate that is running in another worker
+POLL_INTERVAL_SECONDS = 0.5
+
+
+def fingerprint(*parts) -> str:
+    """Hash of the request payload, to reject a key reused for a different request"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class IdempotencyManager:
+    """Runs each (user, Idempotency-Key) pipeline once and replays its result
+
+    The claim and the stored result live in the shared store so duplicates are
+    recognised by every worker. Duplicates that arrive while the first request
+    is still running wait for it: on the same worker they await the same
+    task, on other workers they poll the store.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.running = {}
+
+    async def run(self, user_id, key, request_fingerprint, pipeline, succeeded=None):
+        """Return (result, replayed) for the pipeline identified by key
+
+        pipeline is a zero-argument coroutine function; it only runs if no
+        request with this key has completed or is in flight. Only results
+        that succeeded(result) accepts (and that didn't raise) are stored for
+        replay; otherwise the key is released so a retry runs the pipeline again.
+        """
+        store_key = f"idempotency:{user_id}:{key}"
+        claimed = await self.store.add(
+            store_key,
+            {'state': 'pending', 'fingerprint': request_fingerprint},
+            ttl=IDEMPOTENCY_PENDING_SECONDS
+        )
+        if claimed:
+            # Shielded so a disconnecting client doesn't cancel work duplicates are waiting on
+            task = asyncio.ensure_future(
+                self._execute(store_key, request_fingerprint, pipeline, succeeded)
+            )
+            self.running[store_key] = task
+            task.add_done_callback(lambda _: self.running.pop(store_key, None))
+            return await asyncio.shield(task), False
+
+        record = await self.store.get(store_key)
+        if record is not None and record['fingerprint'] != request_fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request"
+            )
+
+        task = self.running.get(store_key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        return await self._wait_for_other_worker(store_key), True
+
+    async def _execute(self, store_key, request_fingerprint, pipeline, succeeded):
+        try:
+            result = await pipeline()
+        except BaseException:
+            # Let a retry run the pipeline again
+            await self.store.delete(store_key)
+            raise
+        if succeeded is not None and not succeeded(result):
+            await self.store.delete(store_key)
+            return result
+        await self.store.set(
+            store_key,
+            {'state': 'done', 'fingerprint': request_fingerprint, 'result': result},
+            ttl=IDEMPOTENCY_TTL_SECONDS
+        )
+        return result
+
+    async def _wait_for_other_worker(self, store_key):
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + IDEMPOTENCY_PENDING_SECONDS
+        while loop.time() < give_up_at:
+            record = await self.store.get(store_key)
+            if record is None:
+                break
+            if record['state'] == 'done':
+                return record['result']
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The original request with this Idempotency-Key did not complete; retry",
+            headers={"Retry-After": "1"}
+        )
@@ -1,21 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Request, Depends, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, Request, Response, Depends, HTTPException, Form, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from .auth import create_access_token, get_current_user, User, Token
-from pydantic import BaseModel
-from typing import Dict, Any
+from .rate_limit import RateLimiter
+from .idempotency import IdempotencyManager, fingerprint
+from .compression import CompressionMiddleware
+from pydantic import BaseModel, Field
+from typing import Dict, Any, Optional
 import uvicorn
 import sys
 from pathlib import Path
 import logging
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Create FastAPI app
-app = FastAPI()
+# Create FastAPI app; responses are serialized with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -27,6 +30,9 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Brotli/gzip for JSON payloads; audio is passed through untouched
+app.add_middleware(CompressionMiddleware)
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -35,64 +41,346 @@ logger = logging.getLogger(__name__)
 app_dir = Path(__file__).parent.parent
 sys.path.append(str(app_dir))
 
-from model.predictor import AIModel
-from database.db_manager import DatabaseManager
+from model.predictor import AIModel, Deadline, CircuitOpenError, TRANSIENT_ERRORS
+import math
+from database.db_manager import DatabaseManager, PROMPT_LEVELS
+from database.async_repository import create_repository, SQLiteRepository
 from storage.storage_manager import StorageManager
+from database import bulk
+from database.recording_repository import RecordingRepository
+from database.shared_store import AsyncStore, create_store
+from database.retention import RetentionWorker, RETENTION_INTERVAL_SECONDS, RETENTION_DAYS
+import asyncio
+import contextlib
 import uuid
-import json
+from starlette.concurrency import run_in_threadpool
 
-# Initialize services
-model = AIModel()
-db_manager = DatabaseManager()
+# Initialize services. Each worker process imports this module, so these are per-worker;
+# the Google clients are created on first use rather than at import.
+# Handlers use the async repository (SQLite or Postgres, per DATABASE_URL). The synchronous
+# DatabaseManager is only kept for the SQLite-only bulk exports and reconciliation.
+database = create_repository()
+db_manager = DatabaseManager(database.db_path) if isinstance(database, SQLiteRepository) else None
 storage_manager = StorageManager()
+recording_repository = RecordingRepository(db_manager, storage_manager, database)
+shared_store = AsyncStore(create_store())
+rate_limiter = RateLimiter(shared_store)
+idempotency = IdempotencyManager(shared_store)
+_model = None
+
+def get_model() -> AIModel:
+    global _model
+    if _model is None:
+        _model = AIModel()
+    return _model
+
+# In-flight analyses, drained on shutdown
+DRAIN_TIMEOUT_SECONDS = float(os.getenv('DRAIN_TIMEOUT_SECONDS', '60'))
+inflight_analyses = 0
+analyses_drained = asyncio.Event()
+analyses_drained.set()
+accepting_analyses = True
+
+# How often the background job repairs storage/database drift
+RECONCILE_INTERVAL_SECONDS = int(os.getenv('RECONCILE_INTERVAL_SECONDS', '3600'))
+
+def reconcile_recordings(loop):
+    if db_manager is None:
+        # Rows live in the async backend; look them up on the event loop
+        def get_filenames(user_id):
+            return asyncio.run_coroutine_threadsafe(database.get_user_filenames(user_id), loop).result()
+        return RecordingRepository(None, storage_manager).reconcile(get_filenames=get_filenames)
+    
+    # Runs in a worker thread, so it needs its own SQLite connection
+    worker_db = DatabaseManager(db_manager.db_path)
+    try:
+        return RecordingRepository(worker_db, storage_manager).reconcile()
+    finally:
+        worker_db.conn.close()
+
+async def reconcile_periodically():
+    while True:
+        try:
+            # Only one worker per interval takes the lease and runs the job
+            if await shared_store.add('reconcile-lease', os.getpid(), ttl=RECONCILE_INTERVAL_SECONDS):
+                # Stale progress cache versions and finished idempotency records are only dropped here
+                await shared_store.purge_expired()
+                await run_in_threadpool(reconcile_recordings, asyncio.get_running_loop())
+        except Exception as e:
+            logger.error(f"Error reconciling recordings: {e}")
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def open_database():
+    await database.open()
+
+async def retain_periodically():
+    worker = RetentionWorker(recording_repository, shared_store, on_change=invalidate_progress)
+    while True:
+        try:
+            # Passes are bounded and checkpointed, so a single worker at a time can resume them
+            if await shared_store.add('retention-lease', os.getpid(), ttl=RETENTION_INTERVAL_SECONDS):
+                await worker.run_once()
+        except Exception as e:
+            logger.error(f"Error applying retention: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_reconciliation():
+    app.state.reconcile_task = None
+    if RECONCILE_INTERVAL_SECONDS > 0:
+        app.state.reconcile_task = asyncio.create_task(reconcile_periodically())
+    app.state.retention_task = None
+    if RETENTION_INTERVAL_SECONDS > 0:
+        app.state.retention_task = asyncio.create_task(retain_periodically())
+
+@app.on_event("shutdown")
+async def drain_analyses():
+    global accepting_analyses
+    accepting_analyses = False
+    for task in (app.state.reconcile_task, app.state.retention_task):
+        if task is not None:
+            task.cancel()
+    
+    logger.info(f"Draining {inflight_analyses} in-flight analyses")
+    try:
+        await asyncio.wait_for(analyses_drained.wait(), timeout=DRAIN_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutting down with {inflight_analyses} analyses still in flight")
+    await database.close()
+
+@contextlib.asynccontextmanager
+async def track_analysis():
+    global inflight_analyses
+    if not accepting_analyses:
+        raise HTTPException(status_code=503, detail="Server is shutting down",
+                            headers={"Retry-After": "1"})
+    inflight_analyses += 1
+    analyses_drained.clear()
+    try:
+        yield
+    finally:
+        inflight_analyses -= 1
+        if inflight_analyses == 0:
+            analyses_drained.set()
+
+PROGRESS_CACHE_SECONDS = 300
+
+# Users allowed to add prompts to the shared bank (comma-separated usernames)
+PROMPT_ADMIN_USERS = {user.strip() for user in os.getenv('PROMPT_ADMIN_USERS', '').split(',') if user.strip()}
+PROMPT_LEVEL_PATTERN = f"^({'|'.join(PROMPT_LEVELS)})$"
+
+async def invalidate_progress(user_id: str):
+    await shared_store.incr(f"progress-version:{user_id}")
 
 class UserCreate(BaseModel):
     username: str
     password: str
 
+class RetentionPolicy(BaseModel):
+    # None keeps recordings forever
+    retain_days: Optional[int] = Field(None, ge=1)
+
+class PromptCreate(BaseModel):
+    text: str = Field(..., min_length=1, max_length=1000)
+    level: Optional[str] = Field(None, pattern=PROMPT_LEVEL_PATTERN)
+    reference_answer: Optional[str] = Field(None, max_length=5000)
+
 @app.post("/api/analyze-audio")
 async def analyze_audio(
+    response: Response,
     audio: UploadFile = File(...),
-    prompt: str = Form(...),
+    prompt: Optional[str] = Form(None),
+    prompt_id: Optional[int] = Form(None),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_user: User = Depends(get_current_user)
 ):
+    # A bank prompt (prompt_id) takes precedence over free-text prompt
+    if prompt_id is not None:
+        bank_prompt = await database.get_prompt(prompt_id)
+        if bank_prompt is None:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+    elif prompt:
+        bank_prompt = None
+    else:
+        raise HTTPException(status_code=422, detail="Either prompt or prompt_id is required")
+    
     logger.debug(f"Received audio file: {audio.filename}")
     audio_bytes = await audio.read()
     logger.debug(f"Audio size: {len(audio_bytes)} bytes")
     
-    result = model.predict(audio_bytes)
-    logger.debug(f"Model prediction result: {result}")
+    async def pipeline():
+        return await run_analysis(response, audio_bytes, prompt, current_user, bank_prompt)
     
-    # Get detailed grading for the transcription
-    grading_result = model.grade_response(
-        prompt,
-        result.get('transcription', '')
-    )
+    if not idempotency_key:
+        return await pipeline()
     
-    # Save to storage and database using current user's username
-    filename = f"recording_{uuid.uuid4()}.wav"
-    storage_manager.save_recording(user_id=current_user.username, audio_data=audio_bytes, filename=filename)
-    db_manager.save_recording(
-        user_id=current_user.username,
-        filename=filename,
-        transcription=result.get('transcription'),
-        model_response=json.dumps(result),
-        prompt=prompt,
-        grading_result=result.get('grading_details', {})
+    # Retries with the same key replay (or wait for) the first request's result
+    result, replayed = await idempotency.run(
+        current_user.username,
+        idempotency_key,
+        fingerprint(audio_bytes, prompt if bank_prompt is None else f"prompt:{prompt_id}"),
+        pipeline,
+        # A failure is never replayed; retries with the key analyze again
+        succeeded=lambda result: result.get('status') == 'success'
     )
+    if replayed:
+        logger.debug(f"Replaying result for Idempotency-Key: {idempotency_key}")
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def run_analysis(response: Response, audio_bytes: bytes, prompt: Optional[str],
+                       current_user: User, bank_prompt: Optional[dict] = None):
+    # Per-user request/audio/LLM budgets; raises 429 with Retry-After when exhausted
+    remaining = await rate_limiter.enforce(current_user.username)
     
-    # Add grading details to the response
-    result['grading_details'] = grading_result
+    question = bank_prompt['text'] if bank_prompt else prompt
+    async with track_analysis():
+        # Blocking cloud calls run off the event loop so the worker keeps serving requests.
+        # Transcription and grading share one request budget.
+        model = get_model()
+        deadline = Deadline()
+        try:
+            result = await run_in_threadpool(
+                model.predict, audio_bytes, deadline,
+                question=question,
+                reference_answer=bank_prompt['reference_answer'] if bank_prompt else None,
+                level=bank_prompt['level'] if bank_prompt else None
+            )
+            logger.debug(f"Model prediction result: {result}")
+        except CircuitOpenError as e:
+            logger.warning(f"Rejecting analysis: {e}")
+            raise HTTPException(status_code=503, detail=str(e),
+                                headers={"Retry-After": str(math.ceil(e.retry_after))})
+        except TimeoutError as e:
+            logger.warning(f"Analysis timed out: {e}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except TRANSIENT_ERRORS as e:
+            logger.warning(f"Analysis failed after retries: {e!r}")
+            raise HTTPException(status_code=503, detail="Speech or grading service unavailable",
+                                headers={"Retry-After": "5"})
+        
+        # Nothing is stored or charged for a failed analysis; zero grades would skew progress
+        if result.get('status') != 'success':
+            raise HTTPException(status_code=502, detail=f"Analysis failed: {result.get('error')}")
+        if result['grading_details'].get('failed'):
+            raise HTTPException(status_code=502, detail="Grading failed, please retry")
+        
+        # Save to storage and database as one unit using current user's username
+        filename = f"recording_{uuid.uuid4()}.wav"
+        await recording_repository.save(
+            user_id=current_user.username,
+            audio_data=audio_bytes,
+            filename=filename,
+            transcription=result.get('transcription'),
+            model_response=result,
+            prompt=question,
+            prompt_id=bank_prompt['id'] if bank_prompt else None,
+            grading_result=result.get('grading_details', {})
+        )
+        await invalidate_progress(current_user.username)
+    
+    # Charge what the analysis actually consumed
+    audio_seconds = result.get('metadata', {}).get('audio_duration', 0)
+    llm_tokens = (result.get('grading_details') or {}).get('token_count', 0)
+    remaining['audio-seconds'] = await rate_limiter.charge(current_user.username, 'audio-seconds', audio_seconds)
+    remaining['llm-tokens'] = await rate_limiter.charge(current_user.username, 'llm-tokens', llm_tokens)
+    response.headers.update(rate_limiter.headers(remaining))
     
     logger.debug(f"Returning result: {result}")
     return result
 
+@app.get("/api/prompts")
+async def get_prompts(
+    level: Optional[str] = Query(None, pattern=PROMPT_LEVEL_PATTERN),
+    current_user: User = Depends(get_current_user)
+):
+    """List the prompt bank; reference answers are only used for grading"""
+    return await database.list_prompts(level)
+
+@app.post("/api/prompts", status_code=201)
+async def create_prompt(prompt: PromptCreate, current_user: User = Depends(get_current_user)):
+    """Add a prompt to the bank"""
+    if current_user.username not in PROMPT_ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Not allowed to add prompts")
+    logger.debug(f"Adding prompt for user: {current_user.username}")
+    return await database.create_prompt(prompt.text, prompt.level, prompt.reference_answer)
+
 @app.get("/api/recordings")
-async def get_recordings(current_user: User = Depends(get_current_user)):
+async def get_recordings(
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """The current user's recordings, newest first; all of them unless limit is given"""
     logger.debug(f"Fetching recordings for user: {current_user.username}")
-    recordings = db_manager.get_user_recordings(current_user.username)
+    recordings = await database.get_user_recordings(current_user.username, limit=limit, offset=offset)
     logger.debug(f"Found recordings: {recordings}")
-    return recordings
+    # model_response is embedded pre-encoded; skip jsonable_encoder, which can't handle it
+    return ORJSONResponse(recordings)
+
+@app.get("/api/recordings/search")
+async def search_recordings(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user)
+):
+    """Search the current user's transcriptions and grading notes"""
+    logger.debug(f"Searching recordings for user: {current_user.username}, query: {q}")
+    return await database.search_recordings(current_user.username, q, limit=limit, offset=offset)
+
+@app.get("/api/progress")
+async def get_progress(
+    bucket: str = Query("daily", pattern="^(daily|weekly)$"),
+    limit: int = Query(90, ge=1, le=366),
+    current_user: User = Depends(get_current_user)
+):
+    """Get grade averages and a daily/weekly series from the per-user aggregates"""
+    logger.debug(f"Fetching {bucket} progress for user: {current_user.username}")
+    # Cached across workers; the key's version is bumped whenever the user's recordings change
+    version = await shared_store.get(f"progress-version:{current_user.username}", 0)
+    cache_key = f"progress:{current_user.username}:{version}:{bucket}:{limit}"
+    progress = await shared_store.get(cache_key)
+    if progress is None:
+        progress = await database.get_user_progress(current_user.username, bucket=bucket, limit=limit)
+        await shared_store.set(cache_key, progress, ttl=PROGRESS_CACHE_SECONDS)
+    return progress
+
+def require_sqlite_export():
+    if db_manager is None:
+        raise HTTPException(status_code=501, detail="Exports are only available with the SQLite backend")
+
+@app.get("/api/export")
+async def export_recordings(
+    format: str = Query("csv", pattern="^(csv|arrow)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the current user's recordings metadata and grades"""
+    logger.debug(f"Exporting recordings for user: {current_user.username} as {format}")
+    require_sqlite_export()
+    if format == 'arrow':
+        try:
+            bulk.require_pyarrow()
+        except RuntimeError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+    
+    return StreamingResponse(
+        bulk.iter_export(db_manager, user_id=current_user.username, fmt=format),
+        media_type=bulk.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="recordings.{format}"'}
+    )
+
+@app.get("/api/export/audio")
+async def export_audio(current_user: User = Depends(get_current_user)):
+    """Stream the current user's audio files as a tar archive"""
+    logger.debug(f"Exporting audio for user: {current_user.username}")
+    require_sqlite_export()
+    return StreamingResponse(
+        bulk.iter_audio_tar(db_manager, storage_manager, user_id=current_user.username),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": 'attachment; filename="recordings.tar"'}
+    )
 
 @app.get("/api/recordings/{filename}")
 async def get_recording_audio(
@@ -106,14 +394,29 @@ async def get_recording_audio(
     if file_path.exists():
         return FileResponse(
             path=str(file_path),
-            media_type="audio/wav",
+            # Old recordings are transcoded to Ogg/Opus by the retention worker
+            media_type="audio/ogg" if file_path.suffix == ".opus" else "audio/wav",
             filename=filename
         )
     return {"error": "File not found"}
 
+@app.get("/api/retention-policy")
+async def get_retention_policy(current_user: User = Depends(get_current_user)):
+    """How long the current user's recordings are kept"""
+    policy = await database.get_retention_policy(current_user.username)
+    if policy is None:
+        return {"retain_days": RETENTION_DAYS, "is_default": True}
+    return {"retain_days": policy['retain_days'], "is_default": False}
+
+@app.put("/api/retention-policy")
+async def set_retention_policy(policy: RetentionPolicy, current_user: User = Depends(get_current_user)):
+    """Set how long the current user's recordings are kept; expired ones are deleted in the background"""
+    await database.set_retention_policy(current_user.username, policy.retain_days)
+    return {"retain_days": policy.retain_days, "is_default": False}
+
 @app.post("/api/signup")
 async def signup(user: UserCreate):
-    if db_manager.create_user(user.username, user.password):
+    if await database.create_user(user.username, user.password):
         return {"message": "User created successfully"}
     raise HTTPException(
         status_code=400,
@@ -122,7 +425,7 @@ async def signup(user: UserCreate):
 
 @app.post("/api/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    if db_manager.verify_user(form_data.username, form_data.password):
+    if await database.verify_user(form_data.username, form_data.password):
         access_token = create_access_token(
             data={"sub": form_data.username}
         )
@@ -140,20 +443,14 @@ async def delete_recording(
     try:
         logger.debug(f"Deleting recording: {recording_id} for user: {current_user.username}")
         
-        # First get the recording to find its filename
-        recording = db_manager.get_recording_by_id(current_user.username, recording_id)
-        if not recording:
+        # Row and audio file are removed together
+        if await recording_repository.delete(current_user.username, recording_id) is None:
             raise HTTPException(status_code=404, detail="Recording not found")
-        
-        # Delete the audio file
-        storage_manager.delete_recording(current_user.username, recording['filename'])
-        
-        # Delete from database
-        result = db_manager.delete_recording_by_id(current_user.username, recording_id)
-        if not result:
-            raise HTTPException(status_code=500, detail="Failed to delete recording from database")
+        await invalidate_progress(current_user.username)
             
         return {"message": "Recording deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting recording: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,97 @@
+import math
+import os
+import time
+from dataclasses import dataclass
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Token bucket: holds up to capacity tokens, refilled evenly over period seconds"""
+    capacity: float
+    period: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.period
+
+
+# Per-user budgets for /api/analyze-audio
+ANALYSIS_LIMITS = {
+    'requests': Limit(float(os.getenv('RATE_LIMIT_REQUESTS_PER_MINUTE', '10')), 60),
+    'audio-seconds': Limit(float(os.getenv('RATE_LIMIT_AUDIO_SECONDS_PER_DAY', '1800')), 86400),
+    'llm-tokens': Limit(float(os.getenv('RATE_LIMIT_LLM_TOKENS_PER_DAY', '200000')), 86400),
+}
+
+
+class RateLimiter:
+    """Token-bucket limits per user, kept in a shared store so all workers agree
+
+    Requests are limited up front. Audio seconds and LLM tokens are only known
+    after the work is done, so they are charged afterwards and may go into
+    debt; a user in debt is refused until the bucket refills.
+    """
+
+    def __init__(self, store, limits=ANALYSIS_LIMITS):
+        self.store = store
+        self.limits = limits
+
+    async def _take(self, user_id, name, cost, required):
+        """Debit cost if the bucket holds at least required tokens: (allowed, remaining, retry_after)"""
+        limit = self.limits[name]
+
+        def update(state):
+            now = time.time()
+            if state is None:
+                tokens = limit.capacity
+            else:
+                tokens = min(limit.capacity, state['tokens'] + (now - state['at']) * limit.refill_rate)
+            if tokens < required:
+                retry_after = (required - tokens) / limit.refill_rate
+                return {'tokens': tokens, 'at': now}, (False, tokens, retry_after)
+            tokens -= cost
+            return {'tokens': tokens, 'at': now}, (True, tokens, 0.0)
+
+        # No expiry: a bucket in debt must stay until it has refilled
+        return await self.store.transact(f"rate:{name}:{user_id}", update)
+
+    async def acquire(self, user_id, name, cost=1):
+        """Take cost tokens if available: returns (allowed, remaining, retry_after)"""
+        return await self._take(user_id, name, cost, required=cost)
+
+    async def ensure_available(self, user_id, name):
+        """Check the user isn't in debt, without charging anything"""
+        return await self._take(user_id, name, 0, required=1e-9)
+
+    async def charge(self, user_id, name, cost):
+        """Charge usage after the fact and return what's left; the bucket may go negative"""
+        return (await self._take(user_id, name, cost, required=-math.inf))[1]
+
+    async def enforce(self, user_id):
+        """Admit one analysis request or raise 429; returns remaining budget per limit"""
+        remaining = {}
+        # Debt is checked first so a refused request doesn't also cost a request token
+        names = sorted(self.limits, key=lambda name: name == 'requests')
+        for name in names:
+            if name == 'requests':
+                allowed, tokens, retry_after = await self.acquire(user_id, name)
+            else:
+                allowed, tokens, retry_after = await self.ensure_available(user_id, name)
+            if not allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Rate limit exceeded: {name}",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after))),
+                             **self.headers(remaining)},
+                )
+            remaining[name] = tokens
+        return remaining
+
+    def headers(self, remaining):
+        return {
+            f"X-RateLimit-Remaining-{name.title()}": str(max(0, math.floor(tokens)))
+            for name, tokens in remaining.items()
+        }
@@ -0,0 +1,220 @@
+"""Re-grade existing recordings under the current grading rubric.
+
+Grades are stored per rubric version in recording_grades, so a backfill adds
+the new scores next to the old ones. With --promote the new scores also become
+the recordings' current grades (and the progress aggregates follow).
+
+Rows are taken in id order, graded concurrently and written back one batch per
+transaction. After each batch the job's cursor is saved in the shared store
+(SHARED_STORE_URL), so a restarted job resumes after the last written batch.
+Model calls share a token-bucket budget across every running backfill.
+
+Rows that fail to grade are counted and left without a grade for the target
+version; run the job again with --restart to retry them.
+
+Usage:
+    python -m app.database.backfill [--job NAME] [--user USER] [--where SQL [--param VALUE ...]]
+                                    [--concurrency N] [--batch-size N] [--promote] [--restart]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+
+from .db_manager import grade_values
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '4'))
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', '50'))
+BACKFILL_REQUESTS_PER_MINUTE = float(os.getenv('BACKFILL_REQUESTS_PER_MINUTE', '60'))
+BACKFILL_LLM_TOKENS_PER_MINUTE = float(os.getenv('BACKFILL_LLM_TOKENS_PER_MINUTE', '100000'))
+
+# Stored by AIModel.transcribe_audio when speech recognition returned nothing
+NO_TRANSCRIPTION = "Could not transcribe audio"
+
+
+class BackfillRunner:
+    """Grades batches of recordings and stores the results under rubric_version
+
+    grade is a coroutine function taking a candidate row (id, user_id, prompt,
+    transcription, and the bank prompt's level and reference_answer) and
+    returning an AIModel.grade_response style dict.
+    limiter is a RateLimiter whose limits gate each call: 'requests' is taken
+    before a call and 'llm-tokens' charged after it.
+    """
+
+    def __init__(self, database, grade, store, limiter, rubric_version, job,
+                 where=None, params=(), concurrency=BACKFILL_CONCURRENCY,
+                 batch_size=BACKFILL_BATCH_SIZE, promote=False, on_change=None):
+        self.database = database
+        self.grade = grade
+        self.store = store
+        self.limiter = limiter
+        self.rubric_version = rubric_version
+        self.checkpoint_key = f"backfill:{job}"
+        # One budget for all backfill jobs, separate from the users' own limits;
+        # the job: prefix keeps it from sharing buckets with a user named backfill
+        self.limiter_key = 'job:backfill'
+        self.where = where
+        self.params = params
+        self.batch_size = batch_size
+        self.promote = promote
+        self.on_change = on_change
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def checkpoint(self):
+        return await self.store.get(self.checkpoint_key) or {
+            'last_id': 0, 'graded': 0, 'failed': 0, 'skipped': 0
+        }
+
+    async def reset(self):
+        await self.store.delete(self.checkpoint_key)
+
+    async def run(self, max_rows=None):
+        """Grade candidates until none are left (or max_rows were seen); returns the checkpoint"""
+        state = await self.checkpoint()
+        seen = 0
+        started = time.monotonic()
+        while max_rows is None or seen < max_rows:
+            limit = self.batch_size if max_rows is None else min(self.batch_size, max_rows - seen)
+            rows = await self.database.backfill_candidates(
+                state['last_id'], self.rubric_version, self.where, self.params, limit
+            )
+            if not rows:
+                break
+
+            results = await asyncio.gather(*(self._grade_row(row, state) for row in rows))
+            grades = {
+                row['id']: {**grade_values(result), 'rubric_version': self.rubric_version}
+                for row, result in zip(rows, results) if result is not None
+            }
+            async with self.database.transaction() as conn:
+                written = await self.database.save_grades(conn, grades, promote=self.promote)
+            if self.promote and self.on_change is not None:
+                for user_id in set(written.values()):
+                    await self.on_change(user_id)
+
+            seen += len(rows)
+            state['last_id'] = rows[-1]['id']
+            state['graded'] += len(written)
+            await self.store.set(self.checkpoint_key, state)
+            elapsed = time.monotonic() - started
+            logger.info(f"Backfill at id {state['last_id']}: {state} ({seen / elapsed:.1f} rows/s)")
+            if len(rows) < limit:
+                break
+        return state
+
+    async def _grade_row(self, row, state):
+        if not row['transcription'] or row['transcription'] == NO_TRANSCRIPTION:
+            state['skipped'] += 1
+            return None
+        async with self.semaphore:
+            await self._admit()
+            try:
+                result = await self.grade(row)
+            except Exception as e:
+                logger.error(f"Grading recording {row['id']} failed: {e}")
+                state['failed'] += 1
+                return None
+        if 'llm-tokens' in self.limiter.limits:
+            await self.limiter.charge(self.limiter_key, 'llm-tokens', result.get('token_count', 0))
+        if result.get('failed'):
+            state['failed'] += 1
+            return None
+        return result
+
+    async def _admit(self):
+        """Wait until every budget allows another call, then take one request"""
+        for name in self.limiter.limits:
+            while True:
+                if name == 'requests':
+                    allowed, _, retry_after = await self.limiter.acquire(self.limiter_key, name)
+                else:
+                    allowed, _, retry_after = await self.limiter.ensure_available(self.limiter_key, name)
+                if allowed:
+                    break
+                await asyncio.sleep(retry_after)
+
+
+async def run(args):
+    from app.api.rate_limit import Limit, RateLimiter
+    from app.model.predictor import AIModel, CircuitOpenError, DEFAULT_QUESTION, RUBRIC_VERSION
+    from .async_repository import create_repository
+    from .shared_store import AsyncStore, create_store
+
+    model = AIModel()
+
+    async def grade(row):
+        while True:
+            try:
+                return await asyncio.to_thread(
+                    model.grade_response, row['prompt'] or DEFAULT_QUESTION, row['transcription'],
+                    reference_answer=row['reference_answer'], level=row['level']
+                )
+            except CircuitOpenError as e:
+                logger.warning(f"{e}; waiting")
+                await asyncio.sleep(e.retry_after)
+
+    conditions, params = [], []
+    if args.user:
+        conditions.append('r.user_id = ?')
+        params.append(args.user)
+    if args.where:
+        conditions.append(f'({args.where})')
+        params.extend(args.param)
+
+    store = AsyncStore(create_store())
+    limiter = RateLimiter(store, {
+        'requests': Limit(args.requests_per_minute, 60),
+        'llm-tokens': Limit(args.tokens_per_minute, 60),
+    })
+    database = create_repository()
+    await database.open()
+    try:
+        runner = BackfillRunner(
+            database, grade, store, limiter,
+            rubric_version=RUBRIC_VERSION,
+            job=args.job or f"rubric-{RUBRIC_VERSION}",
+            where=' AND '.join(conditions) or None,
+            params=params,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            promote=args.promote,
+            # Bump the API's progress cache version for users whose current grades changed
+            on_change=lambda user_id: store.incr(f"progress-version:{user_id}")
+        )
+        if args.restart:
+            await runner.reset()
+        return await runner.run(max_rows=args.limit)
+    finally:
+        await database.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-grade LingoGrade recordings under the current rubric")
+    parser.add_argument('--job', help="Checkpoint name (defaults to rubric-<version>)")
+    parser.add_argument('--user', help="Only re-grade this user's recordings")
+    parser.add_argument('--where', help="Extra SQL condition on recordings (alias r), e.g. \"r.timestamp < ?\"")
+    parser.add_argument('--param', action='append', default=[], help="Value for a ? in --where (repeatable)")
+    parser.add_argument('--concurrency', type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument('--requests-per-minute', type=float, default=BACKFILL_REQUESTS_PER_MINUTE)
+    parser.add_argument('--tokens-per-minute', type=float, default=BACKFILL_LLM_TOKENS_PER_MINUTE)
+    parser.add_argument('--limit', type=int, help="Stop after this many recordings")
+    parser.add_argument('--promote', action='store_true',
+                        help="Also make the new grades the recordings' current grades")
+    parser.add_argument('--restart', action='store_true', help="Ignore the saved checkpoint")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    state = asyncio.run(run(args))
+    print(f"Backfill finished at id {state['last_id']}: {state['graded']} graded, "
+          f"{state['failed']} failed, {state['skipped']} skipped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""Bulk export/import of recordings and grades.
+
+Exports stream the recordings table in fixed-size chunks (chunked CSV,
+Arrow IPC stream or Parquet) so memory stays bounded however many rows
+there are. Audio can be streamed separately as a tar archive.
+
+Usage:
+    python -m app.database.bulk export out.csv [--user USER] [--format csv|arrow|parquet]
+    python -m app.database.bulk export-audio out.tar [--user USER]
+    python -m app.database.bulk import in.parquet [--format csv|arrow|parquet]
+"""
+import argparse
+import io
+import math
+import sqlite3
+import tarfile
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+from .db_manager import DatabaseManager, GRADE_COLUMNS, LEGACY_RUBRIC_VERSION
+
+EXPORT_CHUNK_SIZE = 10000
+IMPORT_BATCH_SIZE = 5000
+
+# Column order of an export; ids are not exported and are reassigned on import
+EXPORT_COLUMNS = {
+    'user_id': 'string',
+    'filename': 'string',
+    'timestamp': 'string',
+    'duration': 'float',
+    'transcription': 'string',
+    'model_response': 'string',
+    'metadata': 'string',
+    'prompt': 'string',
+    'pronunciation_grade': 'float',
+    'fluency_grade': 'float',
+    'coherence_grade': 'float',
+    'grammar_grade': 'float',
+    'vocabulary_grade': 'float',
+    'grading_explanation': 'string',
+    'grading_notes': 'string',
+    'rubric_version': 'int',
+    'prompt_id': 'int',
+    'storage_tier': 'string'
+}
+PANDAS_TYPES = {'string': 'object', 'float': 'float64', 'int': 'Int64'}
+
+# Column SQL on import, for columns that need more than a plain placeholder
+IMPORT_VALUES = {
+    # Prompt ids only carry over when this database's bank has the prompt
+    'prompt_id': '(SELECT id FROM prompts WHERE id = ?)',
+    'storage_tier': "COALESCE(?, 'hot')"
+}
+
+FORMATS = ('csv', 'arrow', 'parquet')
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+        return pyarrow
+    except ImportError:
+        raise RuntimeError("Arrow/Parquet export requires pyarrow (poetry install -E parquet)")
+
+
+def _arrow_schema(pa):
+    types = {'string': pa.string(), 'float': pa.float64(), 'int': pa.int64()}
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS.items()])
+
+
+def iter_recording_chunks(db_manager, user_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield DataFrames of at most chunk_size recordings, oldest first"""
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM recordings"
+    params = ()
+    if user_id is not None:
+        query += " WHERE user_id = ?"
+        params = (user_id,)
+    query += " ORDER BY id"
+
+    with closing(_read_connection(db_manager)) as conn:
+        for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunk_size):
+            # Keep a stable schema even when a chunk is entirely NULL in some column
+            for name, kind in EXPORT_COLUMNS.items():
+                chunk[name] = chunk[name].astype(PANDAS_TYPES[kind])
+            yield chunk
+
+
+def _read_connection(db_manager):
+    """Open a separate connection for long reads
+
+    Streaming responses iterate in a worker thread, and a long export should
+    not hold the shared connection's cursor. Each next() of the stream may run
+    on a different threadpool thread; the generator owning the connection only
+    uses it from one thread at a time, so the same-thread check is turned off.
+    """
+    return sqlite3.connect(db_manager.db_path, check_same_thread=False)
+
+
+def iter_export(db_manager, user_id=None, fmt='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield an export as byte chunks, for streaming responses (csv or arrow)"""
+    return _encode_chunks(iter_recording_chunks(db_manager, user_id, chunk_size), fmt)
+
+
+def _encode_chunks(chunks, fmt):
+    if fmt == 'csv':
+        header = True
+        for chunk in chunks:
+            yield chunk.to_csv(index=False, header=header).encode('utf-8')
+            header = False
+        if header:
+            yield (','.join(EXPORT_COLUMNS) + '\n').encode('utf-8')
+    elif fmt == 'arrow':
+        pa = require_pyarrow()
+        schema = _arrow_schema(pa)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+        yield sink.getvalue()
+    else:
+        raise ValueError(f"Streaming export does not support format: {fmt}")
+
+
+def export_to_file(db_manager, path, user_id=None, fmt='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """Write an export to a file, returning the number of rows written"""
+    rows = 0
+
+    def counted_chunks():
+        nonlocal rows
+        for chunk in iter_recording_chunks(db_manager, user_id, chunk_size):
+            rows += len(chunk)
+            yield chunk
+
+    if fmt == 'parquet':
+        pa = require_pyarrow()
+        schema = _arrow_schema(pa)
+        with pa.parquet.ParquetWriter(str(path), schema) as writer:
+            for chunk in counted_chunks():
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        return rows
+
+    with open(path, 'wb') as f:
+        for data in _encode_chunks(counted_chunks(), fmt):
+            f.write(data)
+    return rows
+
+
+def iter_audio_tar(db_manager, storage_manager, user_id=None):
+    """Yield a tar stream of the audio files referenced by recordings"""
+    buffer = _TarBuffer()
+    query = "SELECT user_id, filename FROM recordings"
+    params = ()
+    if user_id is not None:
+        query += " WHERE user_id = ?"
+        params = (user_id,)
+
+    with closing(_read_connection(db_manager)) as conn, \
+            tarfile.open(fileobj=buffer, mode='w|') as tar:
+        for owner, filename in conn.execute(query + " ORDER BY id", params):
+            file_path = storage_manager.get_recording_path(owner, filename)
+            if not file_path.exists():
+                continue
+            tar.add(str(file_path), arcname=f"{owner}/{filename}")
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+class _TarBuffer(io.RawIOBase):
+    """Write-only sink that hands tar output back in pieces"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_import_chunks(path, fmt='csv', chunk_size=IMPORT_BATCH_SIZE):
+    """Yield DataFrames from an export file without loading it whole"""
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={
+            name: PANDAS_TYPES[kind] for name, kind in EXPORT_COLUMNS.items()
+        })
+    elif fmt == 'parquet':
+        pa = require_pyarrow()
+        for batch in pa.parquet.ParquetFile(str(path)).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif fmt == 'arrow':
+        pa = require_pyarrow()
+        with pa.OSFile(str(path), 'rb') as source:
+            for batch in pa.ipc.open_stream(source):
+                yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def import_recordings(db_manager, chunks):
+    """Bulk-insert recordings from DataFrame chunks in a single transaction
+
+    Rows whose (user_id, filename) is already in the database are skipped, so
+    re-importing an export doesn't duplicate recordings. Each imported
+    recording's grades are also added to its rubric's recording_grades
+    history. Returns the number of rows inserted. Nothing is written if any
+    batch fails.
+    """
+    columns = list(EXPORT_COLUMNS)
+    insert = f'''
+        INSERT INTO recordings ({', '.join(columns)})
+        SELECT {', '.join(IMPORT_VALUES.get(column, '?') for column in columns)}
+        WHERE NOT EXISTS (SELECT 1 FROM recordings WHERE user_id = ? AND filename = ?)
+    '''
+    rows = 0
+    with db_manager.conn:
+        c = db_manager.conn.cursor()
+        # Take the write lock before reading MAX(id): a recording saved in between
+        # would already have its grade history row and fail the copy below
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT COALESCE(MAX(id), 0) FROM recordings')
+        last_existing_id = c.fetchone()[0]
+        for chunk in chunks:
+            if 'rubric_version' not in chunk.columns:
+                # Exports from before rubric versions were recorded hold legacy grades
+                chunk = chunk.assign(rubric_version=LEGACY_RUBRIC_VERSION)
+            chunk = chunk.reindex(columns=columns)
+            # user_id and filename lead EXPORT_COLUMNS; they're bound again for NOT EXISTS
+            c.executemany(insert, (
+                values + values[:2]
+                for values in (
+                    tuple(_sql_value(value) for value in record)
+                    for record in chunk.itertuples(index=False, name=None)
+                )
+            ))
+            rows += c.rowcount
+        c.execute(f'''
+            INSERT INTO recording_grades ({', '.join(GRADE_COLUMNS)})
+            SELECT id, rubric_version, {', '.join(GRADE_COLUMNS[2:-1])}, timestamp
+            FROM recordings
+            WHERE id > ? AND rubric_version IS NOT NULL
+        ''', (last_existing_id,))
+        # Aggregates are rebuilt once instead of per row
+        db_manager.rebuild_user_stats(cursor=c)
+    return rows
+
+
+def _sql_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if value is pd.NA or value is pd.NaT:
+        return None
+    # Int64 columns hand back numpy integers, which sqlite3 can't bind
+    return value.item() if hasattr(value, 'item') else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk export/import of LingoGrade recordings")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Export recordings metadata and grades")
+    export_parser.add_argument('path')
+    export_parser.add_argument('--user', help="Only export this user's recordings")
+    export_parser.add_argument('--format', choices=FORMATS, default='csv')
+    export_parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    audio_parser = subparsers.add_parser('export-audio', help="Export audio files as a tar archive")
+    audio_parser.add_argument('path')
+    audio_parser.add_argument('--user', help="Only export this user's recordings")
+
+    import_parser = subparsers.add_parser('import', help="Import recordings from an export")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=FORMATS, default='csv')
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    parser.add_argument('--db-path', help="Database path (defaults to DATABASE_PATH)")
+    args = parser.parse_args(argv)
+
+    db_manager = DatabaseManager(args.db_path)
+
+    if args.command == 'export':
+        rows = export_to_file(db_manager, args.path, args.user, args.format, args.chunk_size)
+        print(f"Exported {rows} recordings to {args.path}")
+    elif args.command == 'export-audio':
+        from app.storage.storage_manager import StorageManager
+        with open(args.path, 'wb') as f:
+            for data in iter_audio_tar(db_manager, StorageManager(), args.user):
+                f.write(data)
+        print(f"Exported audio to {args.path}")
+    elif args.command == 'import':
+        chunks = iter_import_chunks(Path(args.path), args.format, args.batch_size)
+        rows = import_recordings(db_manager, chunks)
+        print(f"Imported {rows} recordings from {args.path}")
+
+
+if __name__ == '__main__':
+    main()
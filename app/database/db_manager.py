@@ -2,24 +2,202 @@ import sqlite3
 from datetime import datetime
 from pathlib import Path
 import os
+import orjson
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Grade dimensions tracked in the per-user progress aggregates
+GRADE_DIMENSIONS = ('pronunciation', 'fluency', 'coherence', 'grammar', 'vocabulary')
+
+# How long a starting process waits for another one to finish migrating the schema
+SCHEMA_LOCK_TIMEOUT_MS = int(os.getenv('SCHEMA_LOCK_TIMEOUT_MS', '600000'))
+
+# Grades stored before rubric versioning came from the first grading rubric
+LEGACY_RUBRIC_VERSION = 1
+
+# CEFR levels a prompt can be pitched at
+PROMPT_LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+
+# Seed for an empty prompt bank: (text, level, reference answer)
+DEFAULT_PROMPTS = [
+    ("Describe your ideal vacation destination and explain why you would choose to visit that place.", 'B1',
+     "My ideal vacation destination is the coast of Portugal. I would choose it because the weather is "
+     "warm, the food is fresh and the small towns are quiet. I could swim in the morning, visit old "
+     "castles in the afternoon and relax by the sea in the evening."),
+    ("What is your favorite hobby and why do you enjoy it?", 'A2',
+     "My favorite hobby is cooking. I cook dinner for my family every weekend. I enjoy it because it is "
+     "relaxing and I like trying new recipes."),
+    ("Tell me about a memorable experience from your childhood.", 'B1',
+     "When I was eight, my grandfather took me fishing for the first time. We woke up very early and "
+     "waited for hours, and when I finally caught a small fish I was so proud. I still remember how "
+     "patient he was with me."),
+    ("If you could have dinner with any historical figure, who would it be and why?", 'B2',
+     "I would have dinner with Marie Curie. I admire how she kept working in a field dominated by men "
+     "and won two Nobel Prizes. I would ask her how she stayed motivated despite the obstacles and "
+     "what she thinks about the way her discoveries are used today."),
+    ("What do you think will be the most significant technological advancement in the next 10 years?", 'C1',
+     "I believe the most significant advancement will be in medicine, particularly personalised "
+     "treatments driven by genetic data and AI. Rather than prescribing the same drug to everyone, "
+     "doctors will be able to tailor therapies to an individual's biology, which could dramatically "
+     "improve outcomes, although it also raises serious questions about privacy and equal access."),
+    ("Describe a challenge you've overcome and what you learned from it.", 'B2',
+     "Moving abroad for university was a real challenge because I didn't speak the language well and "
+     "felt isolated at first. I joined a conversation club and forced myself to speak every day, even "
+     "when I made mistakes. It taught me that progress comes from being willing to feel uncomfortable."),
+    ("What advice would you give to someone learning a new language?", 'B1',
+     "I would tell them to practise a little every day instead of studying for many hours once a week. "
+     "They should listen to music and watch films in the language, and they shouldn't be afraid of "
+     "making mistakes when they speak."),
+    ("If you could instantly master any skill, what would it be and why?", 'B1',
+     "I would like to master playing the piano. I have always loved music, but learning takes many "
+     "years of practice. If I could play well, I would play for my friends and maybe write my own songs."),
+]
+
+GRADE_COLUMNS = ('recording_id', 'rubric_version', *(f'{dim}_grade' for dim in GRADE_DIMENSIONS),
+                 'grading_explanation', 'grading_notes', 'graded_at')
+
+# Upsert of one recording_grades row; ? placeholders, values from grade_row()
+UPSERT_GRADE_SQL = f'''
+    INSERT INTO recording_grades ({', '.join(GRADE_COLUMNS)})
+    VALUES ({', '.join('?' for _ in GRADE_COLUMNS)})
+    ON CONFLICT (recording_id, rubric_version) DO UPDATE SET
+        {', '.join(f'{col} = excluded.{col}' for col in GRADE_COLUMNS[2:])}
+'''
+
+SUM_COLUMNS = ', '.join(f'{dim}_sum' for dim in GRADE_DIMENSIONS)
+SUM_PLACEHOLDERS = ', '.join('?' for _ in GRADE_DIMENSIONS)
+
+def _sum_updates(table):
+    return ', '.join(f'{dim}_sum = {table}.{dim}_sum + excluded.{dim}_sum' for dim in GRADE_DIMENSIONS)
+
+# Add one recording's grades (times sign) to the progress aggregates. Shared by
+# DatabaseManager and AsyncRepository; ? placeholders, with values from
+# stats_delta_values(): (user_id, sign, *values) and (user_id, day, sign, *values)
+USER_STATS_DELTA_SQL = f'''
+    INSERT INTO user_stats (user_id, recording_count, {SUM_COLUMNS}, updated_at)
+    VALUES (?, ?, {SUM_PLACEHOLDERS}, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET
+        recording_count = user_stats.recording_count + excluded.recording_count,
+        {_sum_updates('user_stats')},
+        updated_at = excluded.updated_at
+'''
+DAILY_STATS_DELTA_SQL = f'''
+    INSERT INTO user_stats_daily (user_id, day, recording_count, {SUM_COLUMNS})
+    VALUES (?, ?, ?, {SUM_PLACEHOLDERS})
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        recording_count = user_stats_daily.recording_count + excluded.recording_count,
+        {_sum_updates('user_stats_daily')}
+'''
+# Days whose last recording was deleted
+DELETE_EMPTY_DAYS_SQL = 'DELETE FROM user_stats_daily WHERE user_id = ? AND recording_count <= 0'
+
+def stats_delta_values(grades, sign):
+    return [sign * (grades.get(dim) or 0.0) for dim in GRADE_DIMENSIONS]
+
+def recording_values(user_id, filename, duration=None, transcription=None, model_response=None,
+                     metadata=None, prompt=None, grading_result=None, prompt_id=None):
+    """Column values for a new recordings row, keyed by column name"""
+    return {
+        'user_id': user_id,
+        'filename': filename,
+        'timestamp': datetime.now(),
+        'duration': duration,
+        'transcription': transcription,
+        'model_response': encode_json(model_response),
+        'metadata': metadata,
+        'prompt': prompt,
+        'prompt_id': prompt_id,
+        **grade_values(grading_result)
+    }
+
+def encode_json(value):
+    """Compact JSON text for a JSON column; strings are taken as already encoded"""
+    if value is None or isinstance(value, str):
+        return value
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+def grade_values(grading_result):
+    """Grade columns from an AIModel.grade_response result"""
+    grading_result = grading_result or {}
+    return {
+        # The rubric doesn't score pronunciation or fluency yet, so those stay 0.0
+        **{f'{dim}_grade': grading_result.get(dim, 0.0) for dim in GRADE_DIMENSIONS},
+        'grading_explanation': grading_result.get('explanation', ''),
+        'grading_notes': grading_result.get('notes', ''),
+        'rubric_version': grading_result.get('rubric_version')
+    }
+
+def grade_row(recording_id, values, graded_at=None):
+    """Parameters for UPSERT_GRADE_SQL from a dict of recordings-style grade columns"""
+    return (recording_id, values['rubric_version'],
+            *(values.get(f'{dim}_grade') for dim in GRADE_DIMENSIONS),
+            values.get('grading_explanation'), values.get('grading_notes'),
+            graded_at or datetime.now())
+
+def format_recording(recording_dict):
+    """Format a recordings row (as a dict) for API responses"""
+    # Format timestamp as ISO string
+    if isinstance(recording_dict.get('timestamp'), str):
+        try:
+            # Parse the string timestamp
+            dt = datetime.strptime(recording_dict['timestamp'], '%Y-%m-%d %H:%M:%S.%f')
+            recording_dict['timestamp'] = dt.isoformat()
+        except ValueError:
+            try:
+                # Try alternate format without microseconds
+                dt = datetime.strptime(recording_dict['timestamp'], '%Y-%m-%d %H:%M:%S')
+                recording_dict['timestamp'] = dt.isoformat()
+            except ValueError:
+                # If parsing fails, leave as is
+                pass
+    elif isinstance(recording_dict.get('timestamp'), datetime):
+        recording_dict['timestamp'] = recording_dict['timestamp'].isoformat()
+    return recording_dict
+
+def database_path_from_env():
+    """Resolve the SQLite file from DATABASE_URL (sqlite:///path) or DATABASE_PATH"""
+    url = os.getenv('DATABASE_URL')
+    if url:
+        if not url.startswith('sqlite:///'):
+            raise ValueError(f"Unsupported DATABASE_URL: {url}")
+        return url[len('sqlite:///'):]
+    return os.getenv('DATABASE_PATH', "app/database/recordings.db")
 
 class DatabaseManager:
-    def __init__(self, db_path=None):
-        self.db_path = db_path or os.getenv('DATABASE_PATH', "app/database/recordings.db")
-        self.conn = sqlite3.connect(self.db_path)
-        self.init_db()
-        self.migrate_db()
-        self.create_tables()
-
-    def init_db(self):
+    def __init__(self, db_path=None, check_same_thread=True):
+        self.db_path = db_path or database_path_from_env()
+        # Pass check_same_thread=False only when access is serialized by the caller (e.g. a pool)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=check_same_thread)
+        # WAL lets several worker processes read while one writes; wait on locks instead of failing
+        self.conn.execute(f'PRAGMA busy_timeout={SCHEMA_LOCK_TIMEOUT_MS}')
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.init_schema()
+        self.conn.execute('PRAGMA busy_timeout=5000')
+
+    def init_schema(self):
+        """Create and migrate the schema in one exclusive transaction
+
+        Every worker process does this at startup. The lock makes the others
+        wait and then find each step already done, instead of racing on the
+        same ALTER TABLEs and backfills.
+        """
         c = self.conn.cursor()
-        
+        c.execute('BEGIN EXCLUSIVE')
+        try:
+            self.init_db(c)
+            self.migrate_db(c)
+            self.create_tables(c)
+            self.init_stats_tables(c)
+            self.init_search_index(c)
+            self.init_grades_table(c)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def init_db(self, c):
         # Create recordings table with speech grades
         c.execute('''
             CREATE TABLE IF NOT EXISTS recordings (
@@ -38,16 +216,15 @@ class DatabaseManager:
                 grammar_grade FLOAT,
                 vocabulary_grade FLOAT,
                 grading_explanation TEXT,
-                grading_notes TEXT
+                grading_notes TEXT,
+                storage_tier TEXT NOT NULL DEFAULT 'hot',
+                rubric_version INTEGER,
+                prompt_id INTEGER
             )
         ''')
-        
-        self.conn.commit()
 
-    def migrate_db(self):
+    def migrate_db(self, c):
         """Add new columns if they don't exist"""
-        c = self.conn.cursor()
-        
         # Get existing columns
         c.execute('PRAGMA table_info(recordings)')
         columns = {col[1] for col in c.fetchall()}
@@ -58,161 +235,291 @@ class DatabaseManager:
             'fluency_grade': 'FLOAT',
             'coherence_grade': 'FLOAT',
             'grammar_grade': 'FLOAT',
-            'vocabulary_grade': 'FLOAT'
+            'vocabulary_grade': 'FLOAT',
+            'storage_tier': "TEXT NOT NULL DEFAULT 'hot'",
+            'rubric_version': 'INTEGER',
+            'prompt_id': 'INTEGER'
         }
         
         for col_name, col_type in new_columns.items():
             if col_name not in columns:
                 c.execute(f'ALTER TABLE recordings ADD COLUMN {col_name} {col_type}')
-        
-        self.conn.commit()
 
     def save_recording(self, user_id, filename, duration=None, transcription=None, 
-                      model_response=None, metadata=None, prompt=None, grades=None, grading_result=None):
-        c = self.conn.cursor()
+                      model_response=None, metadata=None, prompt=None, grades=None, grading_result=None,
+                      prompt_id=None, cursor=None):
+        """Insert a recording and return its id
+
+        Pass a cursor to run inside the caller's transaction instead of committing.
+        """
+        c = cursor or self.conn.cursor()
         
-        # Extract grades from grading_result
-        grading_result = grading_result or {}
-        coherence = grading_result.get('coherence', 0.0)
-        grammar = grading_result.get('grammar', 0.0)
-        vocabulary = grading_result.get('vocabulary', 0.0)
-        pronunciation = 0.0  # These could be added later if needed
-        fluency = 0.0
+        values = recording_values(user_id, filename, duration, transcription, model_response,
+                                  metadata, prompt, grading_result, prompt_id)
+        c.execute(f'''
+            INSERT INTO recordings ({', '.join(values)})
+            VALUES ({', '.join('?' for _ in values)})
+        ''', tuple(values.values()))
+        recording_id = c.lastrowid
         
-        # Extract grading details
-        explanation = grading_result.get('explanation', '')
-        notes = grading_result.get('notes', '')
+        # Versioned copy of the grades, so later rubrics can be backfilled alongside them
+        if values['rubric_version'] is not None:
+            c.execute(UPSERT_GRADE_SQL, grade_row(recording_id, values, values['timestamp']))
         
-        c.execute('''
-            INSERT INTO recordings 
-            (user_id, filename, timestamp, duration, transcription, model_response, metadata,
-             prompt, pronunciation_grade, fluency_grade, coherence_grade, grammar_grade, vocabulary_grade,
-             grading_explanation, grading_notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, filename, datetime.now(), duration, transcription, 
-              model_response, metadata, prompt, pronunciation, fluency, coherence, grammar, vocabulary,
-              explanation, notes))
-        
-        self.conn.commit()
-
-    def get_user_recordings(self, user_id):
+        # Keep the progress aggregates in step with the insert (same transaction)
+        self._apply_stats_delta(c, user_id, values['timestamp'].date().isoformat(), {
+            dim: values[f'{dim}_grade'] for dim in GRADE_DIMENSIONS
+        }, 1)
+        
+        if cursor is None:
+            self.conn.commit()
+        return recording_id
+
+    def get_user_recordings(self, user_id, limit=None, offset=0):
         c = self.conn.cursor()
         
-        c.execute('SELECT * FROM recordings WHERE user_id = ? ORDER BY timestamp DESC', 
-                 (user_id,))
+        if limit is None:
+            c.execute('SELECT * FROM recordings WHERE user_id = ? ORDER BY timestamp DESC', 
+                     (user_id,))
+        else:
+            c.execute('SELECT * FROM recordings WHERE user_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?', 
+                     (user_id, limit, offset))
         recordings = c.fetchall()
         
         # Convert to list of dicts with properly formatted timestamps
-        columns = ['id', 'user_id', 'filename', 'timestamp', 'duration', 'transcription', 
-                  'model_response', 'metadata', 'prompt', 'pronunciation_grade', 'fluency_grade', 
-                  'coherence_grade', 'grammar_grade', 'vocabulary_grade', 'grading_explanation', 
-                  'grading_notes']
-        
-        formatted_recordings = []
-        for recording in recordings:
-            recording_dict = dict(zip(columns, recording))
-            # Format timestamp as ISO string
-            if isinstance(recording_dict['timestamp'], str):
-                try:
-                    # Parse the string timestamp
-                    dt = datetime.strptime(recording_dict['timestamp'], '%Y-%m-%d %H:%M:%S.%f')
-                    recording_dict['timestamp'] = dt.isoformat()
-                except ValueError:
-                    try:
-                        # Try alternate format without microseconds
-                        dt = datetime.strptime(recording_dict['timestamp'], '%Y-%m-%d %H:%M:%S')
-                        recording_dict['timestamp'] = dt.isoformat()
-                    except ValueError:
-                        # If parsing fails, leave as is
-                        pass
-            elif isinstance(recording_dict['timestamp'], datetime):
-                recording_dict['timestamp'] = recording_dict['timestamp'].isoformat()
-            
-            formatted_recordings.append(recording_dict)
-        
-        return formatted_recordings
-
-    def create_tables(self):
-        with self.conn:
-            self.conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+        columns = [col[0] for col in c.description]
+        return [format_recording(dict(zip(columns, recording))) for recording in recordings]
 
-    def create_user(self, username: str, password: str) -> bool:
-        try:
-            password_hash = pwd_context.hash(password)
-            with self.conn:
-                self.conn.execute(
-                    'INSERT INTO users (username, password_hash) VALUES (?, ?)',
-                    (username, password_hash)
-                )
-            return True
-        except Exception as e:
-            print(f"Error creating user: {e}")
-            return False
+    def create_tables(self, c):
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Users without a row get RETENTION_DAYS; a NULL retain_days keeps recordings forever
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS retention_policies (
+                user_id TEXT PRIMARY KEY,
+                retain_days INTEGER
+            )
+        ''')
+        # Shared question bank; recordings answering one keep its id in prompt_id
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS prompts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                level TEXT,
+                reference_answer TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        if c.execute('SELECT 1 FROM prompts LIMIT 1').fetchone() is None:
+            c.executemany(
+                'INSERT INTO prompts (text, level, reference_answer) VALUES (?, ?, ?)',
+                DEFAULT_PROMPTS
+            )
 
-    def verify_user(self, username: str, password: str) -> bool:
-        try:
-            with self.conn:
-                result = self.conn.execute(
-                    'SELECT password_hash FROM users WHERE username = ?',
-                    (username,)
-                ).fetchone()
-                if result and pwd_context.verify(password, result[0]):
-                    return True
-            return False
-        except Exception as e:
-            print(f"Error verifying user: {e}")
-            return False
+    def init_stats_tables(self, c):
+        """Create the per-user progress aggregates and backfill them on first run"""
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'")
+        needs_backfill = c.fetchone() is None
+        
+        sum_columns = ',\n'.join(f'{dim}_sum FLOAT NOT NULL DEFAULT 0' for dim in GRADE_DIMENSIONS)
+        
+        # Running totals per user; means are derived as sum / recording_count
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id TEXT PRIMARY KEY,
+                recording_count INTEGER NOT NULL DEFAULT 0,
+                {sum_columns},
+                updated_at DATETIME
+            )
+        ''')
+        
+        # Daily buckets; weekly series and rolling windows are rolled up from these
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS user_stats_daily (
+                user_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                recording_count INTEGER NOT NULL DEFAULT 0,
+                {sum_columns},
+                PRIMARY KEY (user_id, day)
+            )
+        ''')
+        
+        if needs_backfill:
+            self.rebuild_user_stats(c)
+
+    def rebuild_user_stats(self, cursor=None):
+        """Recompute the progress aggregates from the recordings table
+
+        Pass a cursor to run inside the caller's transaction instead of committing.
+        """
+        sum_selects = ', '.join(f'SUM(COALESCE({dim}_grade, 0))' for dim in GRADE_DIMENSIONS)
+        
+        c = cursor or self.conn.cursor()
+        c.execute('DELETE FROM user_stats')
+        c.execute('DELETE FROM user_stats_daily')
+        c.execute(f'''
+            INSERT INTO user_stats (user_id, recording_count, {SUM_COLUMNS}, updated_at)
+            SELECT user_id, COUNT(*), {sum_selects}, CURRENT_TIMESTAMP
+            FROM recordings GROUP BY user_id
+        ''')
+        c.execute(f'''
+            INSERT INTO user_stats_daily (user_id, day, recording_count, {SUM_COLUMNS})
+            SELECT user_id, date(timestamp), COUNT(*), {sum_selects}
+            FROM recordings GROUP BY user_id, date(timestamp)
+        ''')
+        if cursor is None:
+            self.conn.commit()
+
+    def _stats_returning_columns(self):
+        return 'filename, date(timestamp), ' + ', '.join(f'{dim}_grade' for dim in GRADE_DIMENSIONS)
+
+    def _remove_stats_rows(self, c, user_id, deleted_rows):
+        """Subtract deleted recordings (rows of _stats_returning_columns) from the aggregates"""
+        for row in deleted_rows:
+            grades = {dim: value or 0.0 for dim, value in zip(GRADE_DIMENSIONS, row[2:])}
+            self._apply_stats_delta(c, user_id, row[1], grades, -1)
+        if deleted_rows:
+            c.execute(DELETE_EMPTY_DAYS_SQL, (user_id,))
+
+    def _apply_stats_delta(self, c, user_id, day, grades, sign):
+        """Add (sign=1) or remove (sign=-1) one recording's grades from the aggregates"""
+        values = stats_delta_values(grades, sign)
+        c.execute(USER_STATS_DELTA_SQL, (user_id, sign, *values))
+        c.execute(DAILY_STATS_DELTA_SQL, (user_id, day, sign, *values))
+
+    def count_user_recordings(self, user_id):
+        """Number of recordings a user has, read from the aggregates"""
+        c = self.conn.cursor()
+        c.execute('SELECT recording_count FROM user_stats WHERE user_id = ?', (user_id,))
+        row = c.fetchone()
+        return row[0] if row else 0
+
+    def init_grades_table(self, c):
+        """Create the per-rubric grade history and seed it from existing recordings"""
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recording_grades'")
+        needs_backfill = c.fetchone() is None
+        
+        grade_columns = ',\n'.join(f'{dim}_grade FLOAT' for dim in GRADE_DIMENSIONS)
+        
+        # recordings keeps the current grades; this keeps every rubric's grades side by side
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS recording_grades (
+                recording_id INTEGER NOT NULL,
+                rubric_version INTEGER NOT NULL,
+                {grade_columns},
+                grading_explanation TEXT,
+                grading_notes TEXT,
+                graded_at DATETIME NOT NULL,
+                PRIMARY KEY (recording_id, rubric_version)
+            )
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS recording_grades_delete AFTER DELETE ON recordings BEGIN
+                DELETE FROM recording_grades WHERE recording_id = old.id;
+            END
+        ''')
+        
+        if needs_backfill:
+            c.execute('''
+                UPDATE recordings SET rubric_version = ? WHERE rubric_version IS NULL
+            ''', (LEGACY_RUBRIC_VERSION,))
+            c.execute(f'''
+                INSERT INTO recording_grades ({', '.join(GRADE_COLUMNS)})
+                SELECT id, rubric_version, {', '.join(GRADE_COLUMNS[2:-1])}, timestamp
+                FROM recordings
+            ''')
+
+    def init_search_index(self, c):
+        """Create the FTS5 index over transcriptions, grading notes and owner"""
+        c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'recordings_fts'")
+        existing = c.fetchone()
+        needs_rebuild = existing is None
+        if existing is not None and 'user_id' not in existing[0]:
+            # Indexes from before user_id was a column can't be altered; rebuild them
+            for trigger in ('insert', 'delete', 'update'):
+                c.execute(f'DROP TRIGGER IF EXISTS recordings_fts_{trigger}')
+            c.execute('DROP TABLE recordings_fts')
+            needs_rebuild = True
+        
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_recordings_user_timestamp
+            ON recordings (user_id, timestamp)
+        ''')
+        # Lookups by file: import's duplicate check, reconcile and retention moves.
+        # Not UNIQUE, since databases imported before the check may hold duplicates.
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_recordings_user_filename
+            ON recordings (user_id, filename)
+        ''')
+        
+        # External-content table: the text lives only in recordings. user_id is
+        # indexed too so a search matches only the user's own rows instead of
+        # every user's matches being filtered afterwards; it stays the last
+        # column so snippet() prefers the text columns.
+        c.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS recordings_fts USING fts5(
+                transcription,
+                grading_explanation,
+                grading_notes,
+                user_id,
+                content='recordings',
+                content_rowid='id',
+                tokenize='porter unicode61'
+            )
+        ''')
+        
+        # Keep the index in sync with every write to recordings
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS recordings_fts_insert AFTER INSERT ON recordings BEGIN
+                INSERT INTO recordings_fts (rowid, transcription, grading_explanation, grading_notes, user_id)
+                VALUES (new.id, new.transcription, new.grading_explanation, new.grading_notes, new.user_id);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS recordings_fts_delete AFTER DELETE ON recordings BEGIN
+                INSERT INTO recordings_fts (recordings_fts, rowid, transcription, grading_explanation, grading_notes, user_id)
+                VALUES ('delete', old.id, old.transcription, old.grading_explanation, old.grading_notes, old.user_id);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS recordings_fts_update
+            AFTER UPDATE OF transcription, grading_explanation, grading_notes, user_id ON recordings BEGIN
+                INSERT INTO recordings_fts (recordings_fts, rowid, transcription, grading_explanation, grading_notes, user_id)
+                VALUES ('delete', old.id, old.transcription, old.grading_explanation, old.grading_notes, old.user_id);
+                INSERT INTO recordings_fts (rowid, transcription, grading_explanation, grading_notes, user_id)
+                VALUES (new.id, new.transcription, new.grading_explanation, new.grading_notes, new.user_id);
+            END
+        ''')
+        
+        if needs_rebuild:
+            c.execute("INSERT INTO recordings_fts (recordings_fts) VALUES ('rebuild')")
 
     def delete_recording(self, user_id: str, filename: str) -> bool:
         """Delete a recording from the database"""
         try:
             c = self.conn.cursor()
-            c.execute('''
+            c.execute(f'''
                 DELETE FROM recordings 
                 WHERE user_id = ? AND filename = ?
+                RETURNING {self._stats_returning_columns()}
             ''', (user_id, filename))
+            deleted = c.fetchall()
+            self._remove_stats_rows(c, user_id, deleted)
             self.conn.commit()
-            return c.rowcount > 0
+            return len(deleted) > 0
         except Exception as e:
+            self.conn.rollback()
             print(f"Error deleting recording: {e}")
             return False
 
-    def delete_recording_by_id(self, user_id: str, recording_id: int) -> bool:
-        """Delete a recording from the database by ID"""
-        try:
-            c = self.conn.cursor()
-            c.execute('''
-                DELETE FROM recordings 
-                WHERE user_id = ? AND id = ?
-            ''', (user_id, recording_id))
-            self.conn.commit()
-            return c.rowcount > 0
-        except Exception as e:
-            print(f"Error deleting recording: {e}")
-            return False
-
-    def get_recording_by_id(self, user_id: str, recording_id: int) -> dict:
-        """Get a recording by ID"""
-        try:
-            c = self.conn.cursor()
-            c.execute('''
-                SELECT * FROM recordings 
-                WHERE user_id = ? AND id = ?
-            ''', (user_id, recording_id))
-            recording = c.fetchone()
-            if recording:
-                columns = ['id', 'user_id', 'filename', 'timestamp', 'duration', 'transcription', 
-                          'model_response', 'metadata', 'pronunciation_grade', 'fluency_grade', 
-                          'coherence_grade', 'grammar_grade', 'vocabulary_grade']
-                return dict(zip(columns, recording))
-            return None
-        except Exception as e:
-            print(f"Error getting recording: {e}")
-            return None
\ No newline at end of file
+    def get_user_filenames(self, user_id: str) -> set:
+        """Get the filenames of all of a user's recordings"""
+        c = self.conn.cursor()
+        c.execute('SELECT filename FROM recordings WHERE user_id = ?', (user_id,))
+        return {row[0] for row in c.fetchall()}
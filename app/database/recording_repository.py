@@ -0,0 +1,128 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Files younger than this are left alone by reconcile; they may belong to an in-flight save/delete
+RECONCILE_GRACE_SECONDS = 15 * 60
+
+
+class RecordingRepository:
+    """Saves and deletes recordings across storage and database as one unit of work
+
+    A save writes the audio under a partial name, inserts the row, publishes the
+    file and only then commits. A delete removes the row (DELETE ... RETURNING),
+    moves the file to a tombstone, commits and then drops the tombstone. Each
+    step has a compensating action on failure; anything left behind by a crash
+    is cleaned up by reconcile().
+
+    Saves and deletes go through database, an AsyncRepository. reconcile()
+    reads rows through db_manager (a DatabaseManager) unless given
+    get_filenames.
+    """
+
+    def __init__(self, db_manager, storage_manager, database=None):
+        self.db = db_manager
+        self.storage = storage_manager
+        self.database = database
+
+    async def save(self, user_id, audio_data, filename, **fields):
+        """Store the audio file and its database row, returning the recording id
+
+        fields are passed through to AsyncRepository.save_recording.
+        """
+        partial_path = self.storage.write_partial(user_id, filename, audio_data)
+        final_path = None
+        try:
+            async with self.database.transaction() as conn:
+                recording_id = await self.database.save_recording(conn, user_id, filename, **fields)
+                final_path = self.storage.commit_partial(partial_path)
+        except Exception:
+            if final_path is not None:
+                final_path.unlink(missing_ok=True)
+            partial_path.unlink(missing_ok=True)
+            raise
+        return recording_id
+
+    async def delete(self, user_id, recording_id):
+        """Delete a recording's row and file, returning its filename or None if not found"""
+        tombstone = None
+        try:
+            async with self.database.transaction() as conn:
+                filename = await self.database.pop_recording(conn, user_id, recording_id)
+                if filename is None:
+                    return None
+                tombstone = self.storage.stage_delete(user_id, filename)
+        except Exception:
+            if tombstone is not None:
+                self.storage.restore_deleted(tombstone)
+            raise
+
+        if tombstone is not None:
+            try:
+                tombstone.unlink()
+            except OSError as e:
+                # The row is gone either way; reconcile() removes the leftover file
+                logger.warning(f"Could not remove {tombstone}: {e}")
+        return filename
+
+    def reconcile(self, grace_seconds=RECONCILE_GRACE_SECONDS, remove_dangling_rows=False,
+                  get_filenames=None):
+        """Repair storage/database drift left by crashes
+
+        - partial files from interrupted saves are removed
+        - tombstones are restored if their row still exists, otherwise removed
+        - files without a row are removed
+        - rows whose file is missing are counted, and deleted if remove_dangling_rows
+
+        get_filenames(user_id) replaces DatabaseManager.get_user_filenames when
+        the rows live in another backend; dangling rows are then only counted.
+
+        Returns a dict of counts per action.
+        """
+        get_filenames = get_filenames or self.db.get_user_filenames
+        stats = {'partials': 0, 'restored': 0, 'tombstones': 0, 'orphans': 0, 'dangling': 0}
+        cutoff = time.time() - grace_seconds
+        partial_suffix = self.storage.PARTIAL_SUFFIX
+        deleted_suffix = self.storage.DELETED_SUFFIX
+        known = {}
+        seen = {}
+
+        for user_id, file_path in self.storage.iter_user_files():
+            if user_id not in known:
+                known[user_id] = get_filenames(user_id)
+                seen[user_id] = set()
+            name = file_path.name
+
+            if name.endswith(partial_suffix):
+                if file_path.stat().st_mtime < cutoff:
+                    file_path.unlink(missing_ok=True)
+                    stats['partials'] += 1
+            elif name.endswith(deleted_suffix):
+                original = name[:-len(deleted_suffix)]
+                if original in known[user_id]:
+                    seen[user_id].add(original)
+                if file_path.stat().st_mtime >= cutoff:
+                    continue
+                if original in known[user_id]:
+                    # The delete never committed
+                    self.storage.restore_deleted(file_path)
+                    stats['restored'] += 1
+                else:
+                    file_path.unlink(missing_ok=True)
+                    stats['tombstones'] += 1
+            elif name in known[user_id]:
+                seen[user_id].add(name)
+            elif file_path.stat().st_mtime < cutoff:
+                file_path.unlink(missing_ok=True)
+                stats['orphans'] += 1
+
+        for user_id, filenames in known.items():
+            dangling = filenames - seen[user_id]
+            stats['dangling'] += len(dangling)
+            if remove_dangling_rows and self.db is not None:
+                for filename in dangling:
+                    self.db.delete_recording(user_id, filename)
+
+        logger.info(f"Reconciled recordings storage: {stats}")
+        return stats
@@ -0,0 +1,276 @@
+"""Storage tiering and retention for recordings.
+
+Each pass of RetentionWorker:
+- deletes recordings older than their owner's retention policy (RETENTION_DAYS
+  for users without one; unset keeps everything)
+- transcodes recordings older than RETENTION_TRANSCODE_AFTER_DAYS to mono,
+  low-bitrate Opus (unset leaves the original audio alone; transcoding is lossy)
+- moves recordings older than RETENTION_COLD_AFTER_DAYS to COLD_STORAGE_PATH,
+  if one is configured
+
+Work is done in id order in small batches. The position is checkpointed in the
+shared store, so a pass that hits its file budget or is interrupted picks up
+where it stopped. ffmpeg runs at idle CPU/IO priority and file traffic is paced
+to RETENTION_IO_BYTES_PER_SECOND so the worker stays out of the way of live
+requests.
+
+Usage:
+    python -m app.database.retention [--once]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def _optional_int(name, default=None):
+    value = os.getenv(name, default)
+    return int(value) if value not in (None, '') else None
+
+
+RETENTION_INTERVAL_SECONDS = int(os.getenv('RETENTION_INTERVAL_SECONDS', '3600'))
+RETENTION_DAYS = _optional_int('RETENTION_DAYS')
+TRANSCODE_AFTER_DAYS = _optional_int('RETENTION_TRANSCODE_AFTER_DAYS')
+COLD_AFTER_DAYS = _optional_int('RETENTION_COLD_AFTER_DAYS', '90')
+OPUS_BITRATE = os.getenv('RETENTION_OPUS_BITRATE', '24k')
+IO_BYTES_PER_SECOND = int(os.getenv('RETENTION_IO_BYTES_PER_SECOND', str(2 * 1024 * 1024)))
+BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '100'))
+MAX_FILES_PER_PASS = int(os.getenv('RETENTION_MAX_FILES_PER_PASS', '1000'))
+FFMPEG = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+
+OPUS_SUFFIX = '.opus'
+
+
+def low_priority_command():
+    """Prefix that runs a subprocess at idle CPU and IO priority, where available"""
+    prefix = []
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '3']
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '19']
+    return prefix
+
+
+async def transcode_to_opus(source: Path, destination: Path, bitrate=OPUS_BITRATE):
+    """Transcode any audio ffmpeg can read to mono Ogg/Opus tuned for speech"""
+    process = await asyncio.create_subprocess_exec(
+        *low_priority_command(), FFMPEG,
+        '-nostdin', '-y', '-loglevel', 'error',
+        '-i', str(source),
+        '-vn', '-ac', '1', '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip',
+        '-f', 'ogg', str(destination),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed on {source}: {stderr.decode(errors='replace').strip()}")
+
+
+class RetentionWorker:
+    """Expires, transcodes and tiers recordings in the background
+
+    recordings is a RecordingRepository with an async database; deletes go
+    through it so rows, files and progress stats stay consistent. store is an
+    AsyncStore. on_change is a coroutine function called with a user id
+    whenever one of their recordings is deleted.
+    """
+
+    def __init__(self, recordings, store, on_change=None,
+                 retain_days=RETENTION_DAYS,
+                 transcode_after_days=TRANSCODE_AFTER_DAYS,
+                 cold_after_days=COLD_AFTER_DAYS,
+                 io_bytes_per_second=IO_BYTES_PER_SECOND,
+                 batch_size=BATCH_SIZE,
+                 max_files_per_pass=MAX_FILES_PER_PASS):
+        self.recordings = recordings
+        self.database = recordings.database
+        self.storage = recordings.storage
+        self.store = store
+        self.on_change = on_change
+        self.retain_days = retain_days
+        self.transcode_after_days = transcode_after_days
+        self.cold_after_days = cold_after_days if self.storage.cold_path is not None else None
+        self.io_bytes_per_second = io_bytes_per_second
+        self.batch_size = batch_size
+        self.max_files_per_pass = max_files_per_pass
+
+        if self.transcode_after_days is not None and shutil.which(FFMPEG) is None:
+            logger.warning(f"{FFMPEG} not found; recordings will not be transcoded")
+            self.transcode_after_days = None
+
+    async def run_once(self):
+        """Run one bounded pass and return counts per action"""
+        stats = {'expired': 0, 'transcoded': 0, 'moved': 0, 'failed': 0, 'bytes_saved': 0}
+        budget = self.max_files_per_pass
+        budget -= await self._expire(stats, budget)
+        if budget > 0:
+            await self._tier(stats, budget)
+        logger.info(f"Retention pass: {stats}")
+        return stats
+
+    async def _checkpoint(self, name):
+        return await self.store.get(f"retention:{name}", 0)
+
+    async def _save_checkpoint(self, name, batch, limit):
+        # A short batch means the end of the table: start over on the next pass
+        await self.store.set(f"retention:{name}", batch[-1]['id'] if len(batch) == limit else 0)
+
+    async def _expire(self, stats, budget):
+        if self.retain_days is None and not await self._has_policies():
+            return 0
+        processed = 0
+        while processed < budget:
+            limit = min(self.batch_size, budget - processed)
+            batch = await self.database.expired_recordings(
+                await self._checkpoint('expire'), self.retain_days, limit
+            )
+            for row in batch:
+                if await self.recordings.delete(row['user_id'], row['id']) is not None:
+                    stats['expired'] += 1
+                    if self.on_change is not None:
+                        await self.on_change(row['user_id'])
+            processed += len(batch)
+            await self._save_checkpoint('expire', batch, limit)
+            if len(batch) < limit:
+                break
+        return processed
+
+    async def _has_policies(self):
+        async with self.database.connection() as conn:
+            return await conn.fetchval('SELECT 1 FROM retention_policies LIMIT 1') is not None
+
+    async def _tier(self, stats, budget):
+        now = datetime.now()
+        transcode_before = (now - timedelta(days=self.transcode_after_days)
+                            if self.transcode_after_days is not None else None)
+        cold_before = (now - timedelta(days=self.cold_after_days)
+                       if self.cold_after_days is not None else None)
+        if transcode_before is None and cold_before is None:
+            return 0
+
+        processed = 0
+        while processed < budget:
+            limit = min(self.batch_size, budget - processed)
+            batch = await self.database.tiering_candidates(
+                await self._checkpoint('tier'), transcode_before, cold_before, limit
+            )
+            for row in batch:
+                started = time.monotonic()
+                try:
+                    moved_bytes = await self._rewrite(row, transcode_before, cold_before, stats)
+                except Exception as e:
+                    # Skipped until the next full pass comes round again
+                    logger.error(f"Retention failed for recording {row['id']}: {e}")
+                    stats['failed'] += 1
+                    continue
+                await self._pace(moved_bytes, started)
+            processed += len(batch)
+            await self._save_checkpoint('tier', batch, limit)
+            if len(batch) < limit:
+                break
+        return processed
+
+    async def _rewrite(self, row, transcode_before, cold_before, stats):
+        """Transcode and/or move one recording, then repoint its row; returns bytes read"""
+        user_id, filename = row['user_id'], row['filename']
+        source = self.storage.get_recording_path(user_id, filename)
+        if not source.exists():
+            # Dangling row; reconcile reports it
+            return 0
+
+        timestamp = row['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        transcode = (transcode_before is not None and timestamp < transcode_before
+                     and not filename.endswith(OPUS_SUFFIX))
+        tier = 'cold' if cold_before is not None and timestamp < cold_before else row['storage_tier']
+        new_filename = Path(filename).with_suffix(OPUS_SUFFIX).name if transcode else filename
+        if new_filename == filename and tier == row['storage_tier']:
+            return 0
+
+        # Same publish-then-commit order as RecordingRepository.save; reconcile cleans up after crashes
+        source_size = source.stat().st_size
+        partial_path = (self.storage.get_user_directory(user_id, tier)
+                        / (new_filename + self.storage.PARTIAL_SUFFIX))
+        try:
+            if transcode:
+                await transcode_to_opus(source, partial_path)
+            else:
+                await asyncio.to_thread(shutil.copyfile, source, partial_path)
+            final_path = self.storage.commit_partial(partial_path)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+
+        try:
+            async with self.database.transaction() as conn:
+                moved = await self.database.move_recording(
+                    conn, row['id'], filename, new_filename, tier
+                )
+        except BaseException:
+            final_path.unlink(missing_ok=True)
+            raise
+        if not moved:
+            # Deleted (or rewritten) while we worked
+            final_path.unlink(missing_ok=True)
+            return source_size
+
+        source.unlink(missing_ok=True)
+        if transcode:
+            stats['transcoded'] += 1
+            stats['bytes_saved'] += source_size - final_path.stat().st_size
+        if tier != row['storage_tier']:
+            stats['moved'] += 1
+        return source_size
+
+    async def _pace(self, nbytes, started):
+        """Sleep so file traffic averages at most io_bytes_per_second"""
+        if not self.io_bytes_per_second:
+            return
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(max(0.0, nbytes / self.io_bytes_per_second - elapsed))
+
+
+async def run(once=False, interval=RETENTION_INTERVAL_SECONDS):
+    from app.storage.storage_manager import StorageManager
+    from .async_repository import create_repository
+    from .recording_repository import RecordingRepository
+    from .shared_store import AsyncStore, create_store
+
+    database = create_repository()
+    await database.open()
+    try:
+        store = AsyncStore(create_store())
+        recordings = RecordingRepository(None, StorageManager(), database)
+        # Bump the API's progress cache version for users who lost recordings
+        worker = RetentionWorker(recordings, store,
+                                 on_change=lambda user_id: store.incr(f"progress-version:{user_id}"))
+        while True:
+            await worker.run_once()
+            if once:
+                break
+            await asyncio.sleep(interval)
+    finally:
+        await database.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcode, tier and expire LingoGrade recordings")
+    parser.add_argument('--once', action='store_true', help="Run a single pass and exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(once=args.once))
+
+
+if __name__ == '__main__':
+    main()
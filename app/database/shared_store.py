@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class MemoryStore:
+    """Process-local key/value store with expiry
+
+    Only suitable for a single worker; use SQLiteStore (or another backend with
+    the same methods, e.g. Redis) when several processes must share state.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return item
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self._live(key)
+            return default if item is None else item[0]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.data[key] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it is absent; returns True if it was set"""
+        with self.lock:
+            if self._live(key) is not None:
+                return False
+            self.data[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def incr(self, key, amount=1, ttl=None):
+        """Add to a numeric key and return the new value; ttl applies when the key is created"""
+        with self.lock:
+            item = self._live(key)
+            if item is None:
+                item = (0, time.time() + ttl if ttl else None)
+            value = item[0] + amount
+            self.data[key] = (value, item[1])
+            return value
+
+    def transact(self, key, update, ttl=None):
+        """Atomically replace a key's value with update(value)
+
+        update receives the current value (None if absent) and returns
+        (new_value, result); result is returned to the caller.
+        """
+        with self.lock:
+            item = self._live(key)
+            new_value, result = update(None if item is None else item[0])
+            self.data[key] = (new_value, time.time() + ttl if ttl else None)
+            return result
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def purge_expired(self):
+        with self.lock:
+            for key in list(self.data):
+                self._live(key)
+
+
+class SQLiteStore:
+    """Key/value store with expiry shared by every worker process on the host
+
+    A local stand-in for a networked cache: values are JSON-encoded into a small
+    WAL-mode SQLite database next to the main one.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS kv_store (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        ''')
+
+    def _expiry(self, ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('''
+                SELECT value FROM kv_store
+                WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)
+            ''', (key, time.time())).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO kv_store (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), self._expiry(ttl))
+            )
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it is absent; returns True if it was set"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute(
+                    'DELETE FROM kv_store WHERE key = ? AND expires_at <= ?', (key, time.time())
+                )
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO kv_store (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), self._expiry(ttl))
+                )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return cursor.rowcount == 1
+
+    def incr(self, key, amount=1, ttl=None):
+        """Add to a numeric key and return the new value; ttl applies when the key is created"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute(
+                    'DELETE FROM kv_store WHERE key = ? AND expires_at <= ?', (key, time.time())
+                )
+                value = self.conn.execute('''
+                    INSERT INTO kv_store (key, value, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
+                    RETURNING value
+                ''', (key, json.dumps(amount), self._expiry(ttl))).fetchone()[0]
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return json.loads(str(value))
+
+    def transact(self, key, update, ttl=None):
+        """Atomically replace a key's value with update(value)
+
+        update receives the current value (None if absent) and returns
+        (new_value, result); result is returned to the caller.
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute('''
+                    SELECT value FROM kv_store
+                    WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)
+                ''', (key, time.time())).fetchone()
+                new_value, result = update(None if row is None else json.loads(row[0]))
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO kv_store (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(new_value), self._expiry(ttl))
+                )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return result
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute('DELETE FROM kv_store WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM kv_store WHERE expires_at <= ?', (time.time(),))
+
+
+class AsyncStore:
+    """Awaitable view of a store, for code running on an event loop
+
+    SQLiteStore calls can wait up to busy_timeout on another worker's write, so
+    they run in a thread to keep the loop serving requests. MemoryStore calls
+    never block and run inline.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.blocking = not isinstance(store, MemoryStore)
+
+    async def _call(self, method, *args, **kwargs):
+        function = getattr(self.store, method)
+        if not self.blocking:
+            return function(*args, **kwargs)
+        return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def get(self, key, default=None):
+        return await self._call('get', key, default)
+
+    async def set(self, key, value, ttl=None):
+        return await self._call('set', key, value, ttl)
+
+    async def add(self, key, value, ttl=None):
+        return await self._call('add', key, value, ttl)
+
+    async def incr(self, key, amount=1, ttl=None):
+        return await self._call('incr', key, amount, ttl)
+
+    async def transact(self, key, update, ttl=None):
+        return await self._call('transact', key, update, ttl)
+
+    async def delete(self, key):
+        return await self._call('delete', key)
+
+    async def purge_expired(self):
+        return await self._call('purge_expired')
+
+
+def create_store(url=None):
+    """Create the shared store named by SHARED_STORE_URL
+
+    memory://                  process-local (single worker only)
+    sqlite:///path/to/file.db  shared by all workers on the host (default)
+    """
+    url = url or os.getenv('SHARED_STORE_URL', 'sqlite:///app/database/shared_store.db')
+    if url == 'memory://':
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported shared store URL: {url}")
@@ -7,6 +7,8 @@ from storage.storage_manager import StorageManager
 import uuid
 import queue
 import logging
+import contextlib
+import threading
 import soundfile as sf
 import os
 import json
@@ -16,16 +18,80 @@ import plotly.graph_objects as go
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Recordings shown per sidebar page
+RECORDINGS_PAGE_SIZE = 10
+
+class DatabasePool:
+    """Pool of DatabaseManager connections shared by every Streamlit session
+
+    Streamlit runs each script rerun in its own thread, so a connection is
+    checked out for the duration of a call instead of being tied to a thread.
+    """
+    def __init__(self, size=4):
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        try:
+            db_manager = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            db_manager = DatabaseManager(check_same_thread=False) if create else self.idle.get()
+        try:
+            yield db_manager
+        finally:
+            self.idle.put(db_manager)
+
+@st.cache_resource
+def get_model():
+    print("Loading AI model...")
+    model = AIModel()
+    print("Model loaded successfully!")
+    return model
+
+@st.cache_resource
+def get_storage_manager():
+    return StorageManager()
+
+@st.cache_resource
+def get_db_pool():
+    return DatabasePool(size=int(os.getenv('STREAMLIT_DB_POOL_SIZE', '4')))
+
+@st.cache_data(max_entries=256)
+def load_recordings_page(user_id, version, page):
+    """One sidebar page of recordings with model_response already parsed
+
+    version is bumped on every upload, which invalidates the cached pages.
+    """
+    with get_db_pool().connection() as db_manager:
+        total = db_manager.count_user_recordings(user_id)
+        recordings = db_manager.get_user_recordings(
+            user_id,
+            limit=RECORDINGS_PAGE_SIZE,
+            offset=page * RECORDINGS_PAGE_SIZE
+        )
+    
+    for recording in recordings:
+        if recording.get('model_response'):
+            try:
+                recording['model_response'] = json.loads(recording['model_response'])
+            except json.JSONDecodeError:
+                pass
+    return total, recordings
+
 class StreamlitApp:
     def __init__(self):
         logger.debug("Initializing StreamlitApp")
-        print("Loading AI model...")
-        self.model = AIModel()
-        print("Model loaded successfully!")
-        
-        # Initialize managers
-        self.storage_manager = StorageManager()
-        self.db_manager = DatabaseManager()
+        # Heavy clients are process-wide cached resources, not rebuilt on every rerun
+        self.model = get_model()
+        self.storage_manager = get_storage_manager()
+        self.db_pool = get_db_pool()
         
         # For backwards compatibility and testing
         self.recordings_dir = self.storage_manager.base_path
@@ -40,6 +106,10 @@ class StreamlitApp:
             st.session_state.current_audio = None
         if 'show_results' not in st.session_state:
             st.session_state.show_results = False
+        if 'recordings_version' not in st.session_state:
+            st.session_state.recordings_version = 0
+        if 'recordings_page' not in st.session_state:
+            st.session_state.recordings_page = 0
     
     def refresh_sidebar(self):
         """Force sidebar to refresh by incrementing a key"""
@@ -168,6 +238,57 @@ class StreamlitApp:
                     delta=f"{(grade_value - 0.7):.2f}"  # Comparison against baseline
                 )
 
+    def display_recordings_sidebar(self):
+        """Display one page of the user's recordings"""
+        page = st.session_state.recordings_page
+        total, recordings = load_recordings_page(
+            st.session_state.user_id,
+            st.session_state.recordings_version,
+            page
+        )
+        
+        if not recordings:
+            st.info("No recordings yet")
+            return
+        
+        for recording in recordings:
+            try:
+                recording_id = recording['id']
+                filename = recording['filename']
+                model_response = recording.get('model_response')
+                
+                # Create an expander for each recording
+                with st.expander(f"📝 {filename}"):
+                    st.write(f"**Recording ID:** {recording_id}")
+                    if model_response:
+                        st.write("**AI Response:**")
+                        st.write(model_response)
+                    
+                    # Play audio button
+                    audio_path = self.storage_manager.get_recording_path(
+                        st.session_state.user_id, 
+                        filename
+                    )
+                    if audio_path.exists():
+                        st.audio(str(audio_path))
+            except Exception as e:
+                logger.error(f"Error processing recording: {e}")
+                st.error(f"Error displaying recording: {str(e)}")
+        
+        # Pagination controls
+        page_count = max(1, -(-total // RECORDINGS_PAGE_SIZE))
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀", disabled=page == 0, key="recordings_prev"):
+                st.session_state.recordings_page -= 1
+                st.rerun()
+        with col2:
+            st.caption(f"Page {page + 1} of {page_count}")
+        with col3:
+            if st.button("▶", disabled=page + 1 >= page_count, key="recordings_next"):
+                st.session_state.recordings_page += 1
+                st.rerun()
+
     def run(self):
         self.initialize_session()
         st.title("AI Model Interface")
@@ -179,43 +300,7 @@ class StreamlitApp:
         # Sidebar for displaying recordings
         with st.sidebar:
             st.header("Your Recordings")
-            recordings = self.db_manager.get_user_recordings(st.session_state.user_id)
-            
-            if not recordings:
-                st.info("No recordings yet")
-            else:
-                for recording in recordings:
-                    # Debug log to see what we're getting
-                    logger.debug(f"Recording data: {recording}")
-                    
-                    try:
-                        # Unpack the recording tuple safely
-                        recording_data = list(recording)
-                        recording_id = recording_data[0]
-                        filename = recording_data[2] if len(recording_data) > 2 else "Unknown"
-                        model_response = recording_data[3] if len(recording_data) > 3 else None
-                        
-                        # Create an expander for each recording
-                        with st.expander(f"📝 {filename}"):
-                            st.write(f"**Recording ID:** {recording_id}")
-                            if model_response:
-                                try:
-                                    response_data = json.loads(model_response)
-                                    st.write("**AI Response:**")
-                                    st.write(response_data)
-                                except json.JSONDecodeError:
-                                    st.write(model_response)
-                            
-                            # Play audio button
-                            audio_path = self.storage_manager.get_recording_path(
-                                st.session_state.user_id, 
-                                filename
-                            )
-                            if audio_path.exists():
-                                st.audio(str(audio_path))
-                    except Exception as e:
-                        logger.error(f"Error processing recording: {e}")
-                        st.error(f"Error displaying recording: {str(e)}")
+            self.display_recordings_sidebar()
         
         # Main content area
         st.write("### Record Audio")
@@ -236,19 +321,32 @@ class StreamlitApp:
         if audio_bytes and not st.session_state.new_recording:
             try:
                 filename = f"recording_{uuid.uuid4()}.wav"
-                file_path = self.save_audio_file(audio_bytes, filename)
                 
                 # Process with model
                 with st.spinner("Processing..."):
                     result = self.model.predict(audio_bytes)
+                
+                # Failed analyses aren't saved, so their zero grades don't count towards progress
+                if result.get('status') != 'success':
+                    raise RuntimeError(result.get('error'))
+                if result['grading_details'].get('failed'):
+                    raise RuntimeError("Grading failed, please record again")
+                
+                file_path = self.save_audio_file(audio_bytes, filename)
                     
                 # Save to database with grades
-                self.db_manager.save_recording(
-                    user_id=st.session_state.user_id,
-                    filename=filename,
-                    model_response=json.dumps(result),
-                    grades=result.get('grades', {})
-                )
+                with self.db_pool.connection() as db_manager:
+                    db_manager.save_recording(
+                        user_id=st.session_state.user_id,
+                        filename=filename,
+                        model_response=result,
+                        grades=result.get('grades', {}),
+                        grading_result=result['grading_details']
+                    )
+                
+                # Invalidate the cached sidebar pages
+                st.session_state.recordings_version += 1
+                st.session_state.recordings_page = 0
                 
                 # Store results in session state
                 st.session_state.current_result = result
@@ -1,13 +1,17 @@
 import os
 from dotenv import load_dotenv
 import time
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, Optional
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part, SafetySetting
 from google.cloud import speech
 import json
 import datetime
 import logging
+from .resilience import (  # noqa: F401 - re-exported for the API and CLIs
+    ANALYSIS_BUDGET_SECONDS, TRANSIENT_ERRORS, CircuitBreaker, CircuitOpenError, Deadline,
+    ResilientCaller, hedge_percentile_from_env
+)
 
 # Load environment variables
 load_dotenv()
@@ -16,22 +20,96 @@ print("\n=== Google Cloud Configuration ===")
 print(f"Project ID: {os.getenv('GOOGLE_CLOUD_PROJECT_ID')}")
 print("=============================================\n")
 
+# Bump whenever the grading prompt or scale changes; grades are stored per rubric version
+# so existing recordings can be re-graded (app/database/backfill.py) alongside the old scores
+RUBRIC_VERSION = 2
+
+# Audio length estimate used until Speech-to-Text reports the real one: bytes at ~16 kbps,
+# which overestimates typical browser Opus rather than letting it slip past the budget
+ESTIMATED_AUDIO_BYTES_PER_SECOND = 2000
+
+# Question used when a recording has no prompt of its own
+DEFAULT_QUESTION = "Describe your ideal vacation destination"
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-pro')
+
+# The rubric is the same for every request, so it is the grading model's system instruction and
+# each request's prompt only carries the question, its reference answer and the response. The
+# instruction's tokens are still sent and billed on every call: it is far below the minimum size
+# for Vertex context caching (CachedContent), so there is no per-call saving to be had here
+GRADING_INSTRUCTIONS = """You grade English learners' spoken answers to a question. You are given the
+question, optionally the CEFR level it targets and a reference answer, and the learner's transcribed response.
+
+Evaluate the response on coherence, grammar and vocabulary and return only a JSON object:
+{
+    "coherence": (score between 0-1),
+    "grammar": (score between 0-1),
+    "vocabulary": (score between 0-1),
+    "explanation": "brief explanation of the grades",
+    "notes": "additional observations about the response"
+}
+
+Definitions:
+- Coherence: Measures how clearly and logically the response aligns with the question
+- Grammar: Evaluates grammatical correctness of the response
+- Vocabulary: Assesses the diversity and appropriateness of vocabulary used
+
+When a reference answer is given, treat it as an example of a complete answer at the target level.
+Judge the response against that standard, not by how closely its content matches the reference.
+"""
+
+
+def grading_request(question: str, response: str, reference_answer: Optional[str] = None,
+                    level: Optional[str] = None) -> str:
+    """Per-request part of a grading call; the rubric comes from GRADING_INSTRUCTIONS"""
+    lines = [f'Question: "{question}"']
+    if level:
+        lines.append(f"Target level (CEFR): {level}")
+    if reference_answer:
+        lines.append(f'Reference answer: "{reference_answer}"')
+    lines.append(f'User response: "{response}"')
+    return "\n".join(lines)
+
+
+def audio_seconds(response) -> Optional[float]:
+    """Audio length from a recognize response: billed time, else the last result's end offset"""
+    billed = getattr(response, 'total_billed_time', None)
+    if billed:
+        return billed.total_seconds()
+    end = getattr(response.results[-1], 'result_end_time', None) if response.results else None
+    return end.total_seconds() if end else None
+
+
 class AIModel:
-    def __init__(self):
+    def __init__(self, speech_client=None, model=None):
+        """Pass speech_client/model to use other clients (e.g. local fakes) instead of Google Cloud"""
         self.loaded = False
         try:
             print("\n Initializing Google Cloud clients...")
             # Initialize Speech-to-Text client
-            self.speech_client = speech.SpeechClient()
+            self.speech_client = speech_client or speech.SpeechClient()
             
-            # Initialize Vertex AI
-            vertexai.init(
-                project=os.getenv('GOOGLE_CLOUD_PROJECT_ID'),
-                location=os.getenv('GOOGLE_CLOUD_LOCATION', 'us-central1')
-            )
+            if model is None:
+                # Initialize Vertex AI
+                vertexai.init(
+                    project=os.getenv('GOOGLE_CLOUD_PROJECT_ID'),
+                    location=os.getenv('GOOGLE_CLOUD_LOCATION', 'us-central1')
+                )
             
-            # Get Gemini model
-            self.model = GenerativeModel("gemini-pro")
+            # Gemini model used for grading, with the rubric as its system instruction
+            self.model = model or GenerativeModel(GEMINI_MODEL, system_instruction=GRADING_INSTRUCTIONS)
+            
+            # Deadlines, hedging, retries and circuit breaking around each provider
+            self.speech_caller = ResilientCaller(
+                'speech-to-text',
+                call_timeout=float(os.getenv('SPEECH_TIMEOUT_SECONDS', '20')),
+                hedge_percentile=hedge_percentile_from_env('SPEECH_HEDGE_PERCENTILE')
+            )
+            self.gemini_caller = ResilientCaller(
+                'gemini',
+                call_timeout=float(os.getenv('GEMINI_TIMEOUT_SECONDS', '20')),
+                hedge_percentile=hedge_percentile_from_env('GEMINI_HEDGE_PERCENTILE')
+            )
             
             # Configure generation settings
             self.generation_config = {
@@ -39,6 +117,8 @@ class AIModel:
                 "temperature": 1,
                 "top_p": 0.95,
             }
+            # Deterministic grading, so answers to the same question are scored alike
+            self.grading_config = {**self.generation_config, "temperature": 0}
             
             # Configure safety settings
             self.safety_settings = [
@@ -97,7 +177,7 @@ class AIModel:
             return {
                 "audio": audio,
                 "config": config,
-                "duration": len(audio_bytes) / 48000
+                "duration": len(audio_bytes) / ESTIMATED_AUDIO_BYTES_PER_SECOND
             }
         except Exception as e:
             print("\n❌ Error in preprocessing:")
@@ -105,8 +185,12 @@ class AIModel:
             print("=============================================\n")
             raise
 
-    def transcribe_audio(self, processed_data: Dict[str, Any]) -> str:
-        """Transcribe audio using Google Cloud Speech-to-Text"""
+    def transcribe_audio(self, processed_data: Dict[str, Any],
+                         deadline: Optional[Deadline] = None) -> str:
+        """Transcribe audio using Google Cloud Speech-to-Text
+
+        Replaces processed_data["duration"] with the audio length Speech-to-Text reports.
+        """
         try:
             audio = processed_data.get("audio")
             config = processed_data.get("config")
@@ -115,7 +199,16 @@ class AIModel:
                 raise ValueError("Missing audio or config in processed data")
             
             print("Starting transcription...")
-            response = self.speech_client.recognize(config=config, audio=audio)
+            response = self.speech_caller.call(
+                self.speech_client.recognize,
+                config=config,
+                audio=audio,
+                timeout=self.speech_caller.call_timeout,
+                deadline=deadline
+            )
+            duration = audio_seconds(response)
+            if duration:
+                processed_data["duration"] = duration
             
             transcript = ""
             for result in response.results:
@@ -134,39 +227,27 @@ class AIModel:
             print(f"Transcription error: {str(e)}")
             raise
 
-    def grade_response(self, question: str, response: str) -> dict:
+    def grade_response(self, question: str, response: str,
+                       deadline: Optional[Deadline] = None,
+                       reference_answer: Optional[str] = None, level: Optional[str] = None) -> dict:
             """
             Grade a user's response using Gemini
             Returns a structured format for both database storage and API response
             """
             try:
-                prompt = f"""
-                Given a question and user response, return a JSON format evaluating the user's response based on coherence, grammar, and vocabulary.
-
-                Question: "{question}"
-                User Response: "{response}"
-
-                Return only a JSON format with:
-                {{
-                    "coherence": (score between 0-1),
-                    "grammar": (score between 0-1),
-                    "vocabulary": (score between 0-1),
-                    "explanation": "brief explanation of the grades",
-                    "notes": "additional observations about the response"
-                }}
-
-                Definitions:
-                - Coherence: Measures how clearly and logically the response aligns with the question
-                - Grammar: Evaluates grammatical correctness of the response
-                - Vocabulary: Assesses the diversity and appropriateness of vocabulary used
-                """
+                prompt = grading_request(question, response, reference_answer, level)
 
                 print("\n🤖 Sending grading prompt to Gemini:")
                 print(prompt)
                 print("=============================================\n")
 
                 # Get Gemini's response
-                gemini_response = self.model.generate_content(prompt)
+                gemini_response = self.gemini_caller.call(
+                    self.model.generate_content,
+                    prompt,
+                    generation_config=self.grading_config,
+                    deadline=deadline
+                )
                 
                 # Parse the response
                 try:
@@ -178,6 +259,10 @@ class AIModel:
                     
                     # Add timestamp for database storage
                     grading_result['timestamp'] = datetime.datetime.utcnow().isoformat()
+                    grading_result['token_count'] = self.count_tokens(
+                        gemini_response, GRADING_INSTRUCTIONS + prompt
+                    )
+                    grading_result['rubric_version'] = RUBRIC_VERSION
                     
                     return grading_result
                     
@@ -188,9 +273,13 @@ class AIModel:
                         'vocabulary': 0.0,
                         'explanation': 'Failed to parse response',
                         'notes': 'Error occurred during grading',
-                        'timestamp': datetime.datetime.utcnow().isoformat()
+                        'timestamp': datetime.datetime.utcnow().isoformat(),
+                        'failed': True
                     }
                     
+            except (CircuitOpenError,) + TRANSIENT_ERRORS:
+                # Out of time or retries: no grade at all rather than a fallback of zeros
+                raise
             except Exception as e:
                 logging.error(f"Error in grade_response: {str(e)}")
                 return {
@@ -199,11 +288,27 @@ class AIModel:
                     'vocabulary': 0.0,
                     'explanation': 'Failed to parse response',
                     'notes': 'Error occurred during grading',
-                    'timestamp': datetime.datetime.utcnow().isoformat()
+                    'timestamp': datetime.datetime.utcnow().isoformat(),
+                    'failed': True
                 }
 
-    def predict(self, audio_bytes: bytes) -> Dict[str, Any]:
-        """Main prediction pipeline"""
+    def count_tokens(self, gemini_response, prompt: str) -> int:
+        """Tokens billed for a Gemini call, estimated from text length if not reported"""
+        usage = getattr(gemini_response, 'usage_metadata', None)
+        total = getattr(usage, 'total_token_count', None)
+        if total:
+            return int(total)
+        return (len(prompt) + len(gemini_response.text)) // 4
+
+    def predict(self, audio_bytes: bytes, deadline: Optional[Deadline] = None,
+                question: str = DEFAULT_QUESTION, reference_answer: Optional[str] = None,
+                level: Optional[str] = None) -> Dict[str, Any]:
+        """Main prediction pipeline
+
+        Raises CircuitOpenError when a provider is degraded, and TimeoutError (or
+        the provider's transient error) once the deadline or retries run out, so
+        callers can ask the client to retry later instead of storing an empty result.
+        """
         if not self.loaded:
             raise RuntimeError("Model not loaded")
         
@@ -212,12 +317,15 @@ class AIModel:
             processed_data = self.preprocess_audio(audio_bytes)
             
             # Get transcription
-            transcription = self.transcribe_audio(processed_data)
+            transcription = self.transcribe_audio(processed_data, deadline=deadline)
             
             # Get detailed grading
             grading_result = self.grade_response(
-                "Describe your ideal vacation destination",  # This should come from the prompt
-                transcription
+                question,
+                transcription,
+                deadline=deadline,
+                reference_answer=reference_answer,
+                level=level
             )
             
             return {
@@ -230,6 +338,8 @@ class AIModel:
                 }
             }
             
+        except (CircuitOpenError,) + TRANSIENT_ERRORS:
+            raise
         except Exception as e:
             print(f"Prediction error: {str(e)}")
             return {
@@ -0,0 +1,269 @@
+"""Deadlines, retries, hedging and circuit breaking for calls to external providers
+
+Provider SDK calls run in a shared thread pool so a hung call can be
+abandoned at its deadline. Abandoned calls keep their thread until the SDK
+returns, so each ResilientCaller also caps how many of its calls may be
+running at once.
+"""
+import os
+import time
+import random
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Optional
+from google.api_core import exceptions as google_exceptions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Errors worth retrying: the provider may well succeed on the next attempt
+TRANSIENT_ERRORS = (
+    TimeoutError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+)
+
+# Total time one analysis (transcription + grading) may take
+ANALYSIS_BUDGET_SECONDS = float(os.getenv('ANALYSIS_BUDGET_SECONDS', '45'))
+
+PROVIDER_CALL_THREADS = int(os.getenv('PROVIDER_CALL_THREADS', '32'))
+# Calls one provider may have running, hung ones included; the default leaves half the
+# pool to the other provider when one of them stops answering
+PROVIDER_MAX_IN_FLIGHT = int(os.getenv('PROVIDER_MAX_IN_FLIGHT', str(PROVIDER_CALL_THREADS // 2)))
+
+
+def hedge_percentile_from_env(name: str) -> Optional[float]:
+    """Latency percentile (e.g. 0.95) after which to hedge a call; unset turns hedging off
+
+    A hedged call is sent and billed twice, so it is opt-in per provider.
+    """
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else None
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Shared pool for provider calls, so hung calls can be abandoned at their deadline"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=PROVIDER_CALL_THREADS,
+                thread_name_prefix='provider-call'
+            )
+        return _executor
+
+
+class Deadline:
+    """Absolute deadline derived from a request budget"""
+    def __init__(self, budget_seconds: float = ANALYSIS_BUDGET_SECONDS):
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that is failing"""
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} is unavailable, retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated transient failures
+
+    closed -> open after failure_threshold consecutive failures. While open,
+    callers wait (up to max_queued of them, and only as long as their deadline
+    allows) for the reset timeout, then a single half-open probe decides
+    whether the circuit closes again or reopens. Everyone else fails fast.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_queued: int = 16):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_queued = max_queued
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def before_call(self, deadline: Deadline):
+        queued = False
+        with self.condition:
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.state == 'closed':
+                        return
+                    if self.state == 'open' and now >= self.opened_at + self.reset_timeout:
+                        self.state = 'half-open'
+                        self.probe_in_flight = False
+                    if self.state == 'half-open' and not self.probe_in_flight:
+                        self.probe_in_flight = True
+                        return
+                    
+                    retry_after = max(self.opened_at + self.reset_timeout - now, 0.0)
+                    if self.state == 'open':
+                        # Queue until the probe may run, if the deadline allows
+                        wait_for = retry_after
+                        give_up = wait_for >= deadline.remaining()
+                    else:
+                        # Half-open: wait for the probe's outcome
+                        wait_for = deadline.remaining()
+                        give_up = wait_for <= 0
+                    if give_up or (not queued and self.waiting >= self.max_queued):
+                        raise CircuitOpenError(self.name, retry_after or self.reset_timeout)
+                    if not queued:
+                        self.waiting += 1
+                        queued = True
+                    self.condition.wait(timeout=wait_for)
+            finally:
+                if queued:
+                    self.waiting -= 1
+
+    def record_success(self):
+        with self.condition:
+            self.failures = 0
+            if self.state != 'closed':
+                logging.info(f"Circuit for {self.name} closed")
+                self.state = 'closed'
+                self.condition.notify_all()
+
+    def record_failure(self):
+        with self.condition:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logging.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.probe_in_flight = False
+                self.condition.notify_all()
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for choosing the hedging threshold"""
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int = 20) -> Optional[float]:
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ResilientCaller:
+    """Calls one provider with a per-call deadline, hedging, retries and a circuit breaker
+
+    - each attempt gets min(call_timeout, time left in the request deadline)
+    - with a hedge_percentile, an attempt slower than that latency percentile
+      gets a second identical request and whichever answers first wins
+    - transient errors are retried with exponential backoff and jitter
+    - at most max_in_flight calls run at once, counting ones abandoned at their
+      deadline; an attempt waits for a slot within its timeout and a hedge is
+      skipped when none is free
+    """
+    def __init__(self, name: str, call_timeout: float, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 4.0,
+                 hedge_percentile: Optional[float] = None, breaker: Optional[CircuitBreaker] = None,
+                 max_in_flight: int = PROVIDER_MAX_IN_FLIGHT):
+        self.name = name
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self.slots = threading.Semaphore(max_in_flight)
+
+    def call(self, fn, *args, deadline: Optional[Deadline] = None, **kwargs):
+        deadline = deadline or Deadline(self.call_timeout * (self.max_retries + 1))
+        attempt = 0
+        while True:
+            self.breaker.before_call(deadline)
+            try:
+                result = self._attempt(fn, args, kwargs, deadline)
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                attempt += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.0)
+                if attempt > self.max_retries or delay >= deadline.remaining():
+                    raise
+                logging.warning(f"{self.name} call failed ({e!r}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # The provider answered; the request itself was bad
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _attempt(self, fn, args, kwargs, deadline: Deadline):
+        timeout = min(self.call_timeout, deadline.remaining())
+        if timeout <= 0:
+            raise TimeoutError(f"{self.name} request budget exhausted")
+        
+        started = time.monotonic()
+        future = self._submit(fn, args, kwargs, wait_for=timeout)
+        if future is None:
+            raise TimeoutError(f"{self.name} has too many calls still running")
+        futures = [future]
+        
+        hedge_after = None
+        if self.hedge_percentile is not None:
+            hedge_after = self.latency.percentile(self.hedge_percentile)
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            hedge = None if done else self._submit(fn, args, kwargs)
+            if hedge is not None:
+                logging.info(f"Hedging slow {self.name} call after {hedge_after:.2f}s")
+                futures.append(hedge)
+        
+        error = None
+        try:
+            for future in as_completed(futures, timeout=timeout - (time.monotonic() - started)):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.latency.record(time.monotonic() - started)
+                return result
+        except TimeoutError:
+            raise TimeoutError(f"{self.name} call timed out after {timeout:.1f}s")
+        finally:
+            for future in futures:
+                future.cancel()
+        raise error
+
+    def _submit(self, fn, args, kwargs, wait_for: float = 0):
+        """Start fn in the shared pool once a slot is free, or return None after wait_for seconds"""
+        if not self.slots.acquire(timeout=wait_for):
+            return None
+        future = _get_executor().submit(fn, *args, **kwargs)
+        # Runs on completion or cancellation, however long the call hangs
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
@@ -7,12 +7,24 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class StorageManager:
-    def __init__(self, base_path=None):
+    # Suffixes for files that are mid-save or mid-delete; see RecordingRepository
+    PARTIAL_SUFFIX = '.partial'
+    DELETED_SUFFIX = '.deleted'
+
+    def __init__(self, base_path=None, cold_path=None):
         self.base_path = Path(base_path or os.getenv('STORAGE_PATH', "app/storage/recordings"))
         self.base_path.mkdir(parents=True, exist_ok=True)
+        # Optional cold tier for old recordings (e.g. a cheaper disk or a mounted bucket)
+        cold_path = cold_path or os.getenv('COLD_STORAGE_PATH')
+        self.cold_path = Path(cold_path) if cold_path else None
+        if self.cold_path is not None:
+            self.cold_path.mkdir(parents=True, exist_ok=True)
 
-    def get_user_directory(self, user_id):
-        user_dir = self.base_path / user_id
+    def get_user_directory(self, user_id, tier='hot'):
+        root = self.cold_path if tier == 'cold' else self.base_path
+        if root is None:
+            raise ValueError("COLD_STORAGE_PATH is not configured")
+        user_dir = root / user_id
         user_dir.mkdir(exist_ok=True)
         return user_dir
 
@@ -31,7 +43,13 @@ class StorageManager:
         return str(file_path)
 
     def get_recording_path(self, user_id, filename):
-        return self.base_path / user_id / filename
+        """Path of a recording in whichever tier holds it (the hot path if neither does)"""
+        file_path = self.base_path / user_id / filename
+        if self.cold_path is not None and not file_path.exists():
+            cold_file_path = self.cold_path / user_id / filename
+            if cold_file_path.exists():
+                return cold_file_path
+        return file_path
 
     def delete_recording(self, user_id: str, filename: str) -> bool:
         """Delete a recording file from storage"""
@@ -43,4 +61,49 @@ class StorageManager:
             return False
         except Exception as e:
             print(f"Error deleting file: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+    def write_partial(self, user_id: str, filename: str, audio_data: bytes) -> Path:
+        """Write audio under a temporary name; publish it with commit_partial"""
+        partial_path = self.get_user_directory(user_id) / (filename + self.PARTIAL_SUFFIX)
+        with open(partial_path, 'wb') as f:
+            f.write(audio_data)
+        return partial_path
+
+    def commit_partial(self, partial_path: Path) -> Path:
+        """Atomically move a partial file to its final name"""
+        final_path = partial_path.with_name(partial_path.name[:-len(self.PARTIAL_SUFFIX)])
+        os.replace(partial_path, final_path)
+        return final_path
+
+    def stage_delete(self, user_id: str, filename: str):
+        """Move a recording aside so the delete can still be undone
+
+        Returns the tombstone path, or None if the file doesn't exist.
+        """
+        file_path = self.get_recording_path(user_id, filename)
+        if not file_path.exists():
+            return None
+        tombstone = file_path.with_name(file_path.name + self.DELETED_SUFFIX)
+        os.replace(file_path, tombstone)
+        # Fresh mtime so reconciliation leaves in-flight deletes alone
+        os.utime(tombstone)
+        return tombstone
+
+    def restore_deleted(self, tombstone: Path) -> Path:
+        """Undo stage_delete"""
+        file_path = tombstone.with_name(tombstone.name[:-len(self.DELETED_SUFFIX)])
+        os.replace(tombstone, file_path)
+        return file_path
+
+    def iter_user_files(self):
+        """Yield (user_id, path) for every file in storage, across both tiers"""
+        for root in (self.base_path, self.cold_path):
+            if root is None:
+                continue
+            for user_dir in root.iterdir():
+                if not user_dir.is_dir():
+                    continue
+                for file_path in user_dir.iterdir():
+                    if file_path.is_file():
+                        yield user_dir.name, file_path
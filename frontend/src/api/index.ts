@@ -1,8 +1,12 @@
 import { useAuth } from '../contexts/AuthContext';
+import { Progress, Prompt } from '../types';
 
 export interface Api {
-  getRecordings: () => Promise<any>;
-  analyzeAudio: (audioBlob: Blob, prompt: string) => Promise<any>;
+  getRecordings: (limit?: number, offset?: number) => Promise<any>;
+  searchRecordings: (query: string, offset?: number) => Promise<any>;
+  getProgress: (bucket?: 'daily' | 'weekly') => Promise<Progress>;
+  getPrompts: () => Promise<Prompt[]>;
+  analyzeAudio: (audioBlob: Blob, promptId: number) => Promise<any>;
   getRecordingAudio: (filename: string) => Promise<Blob>;
   delete: (path: string) => Promise<any>;
   get: (path: string) => Promise<any>;
@@ -15,31 +19,72 @@ export const useApi = () => {
     'Authorization': `Bearer ${token}`,
   };
 
-  const getRecordings = async () => {
-    const response = await fetch(`/api/recordings`, {
+  const getRecordings = async (limit?: number, offset = 0) => {
+    const params = new URLSearchParams({ offset: String(offset) });
+    if (limit !== undefined) params.set('limit', String(limit));
+    const response = await fetch(`/api/recordings?${params}`, {
       headers,
     });
     if (!response.ok) throw new Error('Failed to fetch recordings');
     return response.json();
   };
 
-  const analyzeAudio = async (audioBlob: Blob, prompt: string) => {
-    const formData = new FormData();
-    formData.append('audio', audioBlob);
-    formData.append('prompt', prompt);
+  const searchRecordings = async (query: string, offset = 0) => {
+    const params = new URLSearchParams({ q: query, offset: String(offset) });
+    const response = await fetch(`/api/recordings/search?${params}`, {
+      headers,
+    });
+    if (!response.ok) throw new Error('Failed to search recordings');
+    return response.json();
+  };
 
-    const response = await fetch(`/api/analyze-audio`, {
-      method: 'POST',
-      headers: {
-        'Authorization': `Bearer ${token}`,
-      },
-      body: formData,
+  const getProgress = async (bucket: 'daily' | 'weekly' = 'daily') => {
+    const response = await fetch(`/api/progress?bucket=${bucket}`, {
+      headers,
     });
+    if (!response.ok) throw new Error('Failed to fetch progress');
+    return response.json();
+  };
 
-    if (!response.ok) throw new Error('Failed to analyze audio');
+  const getPrompts = async () => {
+    const response = await fetch(`/api/prompts`, {
+      headers,
+    });
+    if (!response.ok) throw new Error('Failed to fetch prompts');
     return response.json();
   };
 
+  const analyzeAudio = async (audioBlob: Blob, promptId: number) => {
+    const formData = new FormData();
+    formData.append('audio', audioBlob);
+    formData.append('prompt_id', String(promptId));
+
+    // Same key on every retry, so the server analyzes and stores the upload only once
+    const idempotencyKey = crypto.randomUUID();
+    const maxAttempts = 3;
+
+    for (let attempt = 1; ; attempt++) {
+      try {
+        const response = await fetch(`/api/analyze-audio`, {
+          method: 'POST',
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Idempotency-Key': idempotencyKey,
+          },
+          body: formData,
+        });
+
+        if (response.status === 409 && attempt < maxAttempts) continue;
+        if (!response.ok) throw new Error('Failed to analyze audio');
+        return response.json();
+      } catch (error) {
+        // fetch only throws on network failures; those are worth retrying
+        if (!(error instanceof TypeError) || attempt >= maxAttempts) throw error;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+      }
+    }
+  };
+
   const getRecordingAudio = async (filename: string) => {
     const response = await fetch(`/api/recordings/${filename}`, {
       headers,
@@ -65,6 +110,9 @@ export const useApi = () => {
 
   return {
     getRecordings,
+    searchRecordings,
+    getProgress,
+    getPrompts,
     analyzeAudio,
     getRecordingAudio,
     delete: deleteRecording,
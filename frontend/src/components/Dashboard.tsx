@@ -1,41 +1,50 @@
 import React, { useState, useEffect } from 'react';
 import { AudioRecorder } from './AudioRecorder';
 import { RecordingsList } from './RecordingsList';
+import { ProgressSummary } from './ProgressSummary';
 import { useApi } from '../api';
 import { useAuth } from '../contexts/AuthContext';
-import { Recording } from '../types';
+import { Progress, Prompt, Recording } from '../types';
 import { Link } from 'react-router-dom';
 
-const SPEAKING_PROMPTS = [
-  "Describe your ideal vacation destination and explain why you would choose to visit that place.",
-  "What is your favorite hobby and why do you enjoy it?",
-  "Tell me about a memorable experience from your childhood.",
-  "If you could have dinner with any historical figure, who would it be and why?",
-  "What do you think will be the most significant technological advancement in the next 10 years?",
-  "Describe a challenge you've overcome and what you learned from it.",
-  "What advice would you give to someone learning a new language?",
-  "If you could instantly master any skill, what would it be and why?",
-];
+// Recordings fetched per page; older ones load on demand
+const RECORDINGS_PAGE_SIZE = 10;
 
 export const Dashboard: React.FC = () => {
   const { logout } = useAuth();
   const [recordings, setRecordings] = useState<Recording[]>([]);
+  const [hasMoreRecordings, setHasMoreRecordings] = useState(false);
+  const [progress, setProgress] = useState<Progress | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [recordingError, setRecordingError] = useState<string | null>(null);
   const api = useApi();
+  const [prompts, setPrompts] = useState<Prompt[]>([]);
   const [currentPromptIndex, setCurrentPromptIndex] = useState(0);
+  const currentPrompt = prompts[currentPromptIndex];
 
   useEffect(() => {
     checkApiAndLoadRecordings();
+    api.getPrompts()
+      .then(setPrompts)
+      .catch((error) => console.error('Failed to load prompts:', error));
   }, []);
 
+  // Averages come from the server-side aggregates, not from the loaded recordings
+  const loadProgress = () => {
+    api.getProgress()
+      .then(setProgress)
+      .catch((error) => console.error('Failed to load progress:', error));
+  };
+
   const checkApiAndLoadRecordings = async () => {
     setIsLoading(true);
     setError(null);
+    loadProgress();
     try {
-      const data = await api.getRecordings();
+      const data = await api.getRecordings(RECORDINGS_PAGE_SIZE);
       setRecordings(data);
+      setHasMoreRecordings(data.length === RECORDINGS_PAGE_SIZE);
     } catch (error) {
       console.error('API check failed:', error);
       setError('Failed to connect to the server. Please try again later.');
@@ -44,11 +53,30 @@ export const Dashboard: React.FC = () => {
     }
   };
 
+  const loadMoreRecordings = async () => {
+    try {
+      const data = await api.getRecordings(RECORDINGS_PAGE_SIZE, recordings.length);
+      setRecordings((prev) => [...prev, ...data]);
+      setHasMoreRecordings(data.length === RECORDINGS_PAGE_SIZE);
+    } catch (error) {
+      console.error('Failed to load more recordings:', error);
+    }
+  };
+
+  const handleRecordingsUpdate = (updated: Recording[]) => {
+    setRecordings(updated);
+    loadProgress();
+  };
+
   const handleNewRecording = async (audioBlob: Blob) => {
+    if (!currentPrompt) {
+      setRecordingError('No speaking prompt loaded yet. Please try again in a moment.');
+      return;
+    }
     try {
       setError(null);
       setRecordingError(null);
-      await api.analyzeAudio(audioBlob, SPEAKING_PROMPTS[currentPromptIndex]);
+      await api.analyzeAudio(audioBlob, currentPrompt.id);
       await checkApiAndLoadRecordings();
     } catch (error) {
       console.error('Failed to analyze audio:', error);
@@ -57,7 +85,7 @@ export const Dashboard: React.FC = () => {
   };
 
   const getNextPrompt = () => {
-    setCurrentPromptIndex((prev) => (prev + 1) % SPEAKING_PROMPTS.length);
+    setCurrentPromptIndex((prev) => (prev + 1) % Math.max(prompts.length, 1));
   };
 
   return (
@@ -102,6 +130,7 @@ export const Dashboard: React.FC = () => {
           <div className="grid grid-cols-1 md:grid-cols-1 lg:grid-cols-3 gap-8">
             {/* Recording List Section - Full width on small/medium, 2/3 on large */}
             <div className="order-2 lg:order-1 lg:col-span-2">
+              <ProgressSummary progress={progress} />
               {isLoading ? (
                 <div className="bg-white rounded-lg shadow px-6 py-8">
                   <div className="animate-pulse flex space-x-4">
@@ -115,11 +144,23 @@ export const Dashboard: React.FC = () => {
                   </div>
                 </div>
               ) : (
-                <RecordingsList 
-                  recordings={recordings} 
-                  onAudioRequest={api.getRecordingAudio}
-                  onRecordingsUpdate={setRecordings}
-                />
+                <>
+                  <RecordingsList 
+                    recordings={recordings} 
+                    onAudioRequest={api.getRecordingAudio}
+                    onRecordingsUpdate={handleRecordingsUpdate}
+                  />
+                  {hasMoreRecordings && (
+                    <div className="mt-4 flex justify-center">
+                      <button
+                        onClick={loadMoreRecordings}
+                        className="px-6 py-2 text-sm font-medium rounded-md text-indigo-600 bg-white hover:bg-gray-50 border border-indigo-600"
+                      >
+                        Load older recordings
+                      </button>
+                    </div>
+                  )}
+                </>
               )}
             </div>
 
@@ -138,9 +179,11 @@ export const Dashboard: React.FC = () => {
                     <div className="flex items-start space-x-2">
                       <span className="text-xl">💭</span>
                       <div>
-                        <h3 className="text-sm font-medium text-indigo-800">Speaking Prompt:</h3>
+                        <h3 className="text-sm font-medium text-indigo-800">
+                          Speaking Prompt{currentPrompt?.level && ` (${currentPrompt.level})`}:
+                        </h3>
                         <p className="text-sm text-indigo-600 mt-1">
-                          "{SPEAKING_PROMPTS[currentPromptIndex]}"
+                          {currentPrompt ? `"${currentPrompt.text}"` : 'Loading prompt...'}
                         </p>
                         <button
                           onClick={getNextPrompt}
@@ -0,0 +1,41 @@
+import React from 'react';
+import { GradeAverages, Progress } from '../types';
+
+interface Props {
+  progress: Progress | null;
+}
+
+const DIMENSIONS: Array<[keyof GradeAverages, string]> = [
+  ['coherence', 'Coherence'],
+  ['grammar', 'Grammar'],
+  ['vocabulary', 'Vocabulary'],
+];
+
+// Averages over the rolling window; a dash when there were no recordings in it
+const formatAverage = (value: number | null) =>
+  value === null ? '–' : `${Math.round(value * 100)}%`;
+
+export const ProgressSummary: React.FC<Props> = ({ progress }) => {
+  if (!progress) return null;
+  const { rolling } = progress;
+
+  return (
+    <div className="bg-white rounded-lg shadow px-6 py-6 mb-8">
+      <h2 className="text-lg font-medium text-gray-900 tracking-tight">Your Progress</h2>
+      <p className="text-sm text-gray-500 mt-1">
+        {progress.recording_count} recordings in total, {rolling.recording_count} in the
+        last {rolling.window_days} days
+      </p>
+      <dl className="grid grid-cols-3 gap-4 mt-4">
+        {DIMENSIONS.map(([dimension, label]) => (
+          <div key={dimension} className="bg-indigo-50/50 rounded-lg p-3">
+            <dt className="text-xs font-medium text-indigo-800">{label}</dt>
+            <dd className="text-xl font-semibold text-indigo-600">
+              {formatAverage(rolling.averages[dimension])}
+            </dd>
+          </div>
+        ))}
+      </dl>
+    </div>
+  );
+};
@@ -212,7 +212,7 @@ export const RecordingsList: React.FC<Props> = ({
                         <h4 className="text-sm font-medium text-indigo-800">AI Feedback:</h4>
                         {(() => {
                           try {
-                            const response = JSON.parse(recording.model_response);
+                            const response = recording.model_response!;
                             return (
                               <div className="space-y-4">
                                 {/* Transcription */}
@@ -307,7 +307,7 @@ export const RecordingsList: React.FC<Props> = ({
                               </div>
                             );
                           } catch (e) {
-                            return <p className="text-sm text-indigo-900">{recording.model_response}</p>;
+                            return <p className="text-sm text-indigo-900">{JSON.stringify(recording.model_response)}</p>;
                           }
                         })()}
                       </div>
@@ -5,9 +5,10 @@ export interface Recording {
   timestamp: string;
   duration: number | null;
   transcription: string | null;
-  model_response: string | null;
+  model_response: Record<string, any> | null;
   metadata: string | null;
   prompt: string | null;
+  prompt_id: number | null;
   pronunciation_grade: number | null;
   fluency_grade: number | null;
   coherence_grade: number | null;
@@ -15,4 +16,33 @@ export interface Recording {
   vocabulary_grade: number | null;
   grading_explanation: string | null;
   grading_notes: string | null;
-} 
\ No newline at end of file
+}
+
+export interface Prompt {
+  id: number;
+  text: string;
+  level: 'A1' | 'A2' | 'B1' | 'B2' | 'C1' | 'C2' | null;
+}
+
+export type GradeAverages = Record<
+  'pronunciation' | 'fluency' | 'coherence' | 'grammar' | 'vocabulary',
+  number | null
+>;
+
+export interface ProgressPoint {
+  period: string;
+  recording_count: number;
+  averages: GradeAverages;
+}
+
+export interface Progress {
+  recording_count: number;
+  averages: GradeAverages;
+  rolling: {
+    window_days: number;
+    recording_count: number;
+    averages: GradeAverages;
+  };
+  bucket: 'daily' | 'weekly';
+  series: ProgressPoint[];
+}
@@ -0,0 +1,132 @@
+"""AsyncRepository against SQLite, and against PostgreSQL when TEST_DATABASE_URL is set
+
+    make test-postgres
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.database.async_repository import create_repository
+from app.database.db_manager import DatabaseManager
+
+GRADES = {'coherence': 0.8, 'grammar': 0.7, 'vocabulary': 0.6, 'rubric_version': 2}
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def database_url(request, tmp_path):
+    if request.param == 'sqlite':
+        return f"sqlite:///{tmp_path / 'recordings.db'}"
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    pytest.importorskip('asyncpg')
+    return url
+
+
+@pytest.fixture
+def user_id():
+    # Unique per test, so runs against a shared PostgreSQL don't see each other's rows
+    return f"user-{uuid.uuid4().hex[:12]}"
+
+
+def run(database_url, body):
+    async def main():
+        repository = create_repository(database_url, pool_size=2)
+        await repository.open()
+        try:
+            return await body(repository)
+        finally:
+            await repository.close()
+    return asyncio.run(main())
+
+
+async def save(repository, user_id, filename, **fields):
+    async with repository.transaction() as conn:
+        return await repository.save_recording(conn, user_id, filename, **fields)
+
+
+def test_progress_follows_saves_and_deletes(database_url, user_id):
+    async def body(repository):
+        first = await save(repository, user_id, 'a.wav', grading_result=GRADES)
+        await save(repository, user_id, 'b.wav', grading_result={**GRADES, 'coherence': 0.4})
+
+        progress = await repository.get_user_progress(user_id)
+        assert progress['recording_count'] == 2
+        assert progress['averages']['coherence'] == pytest.approx(0.6)
+        assert progress['rolling']['recording_count'] == 2
+        assert [point['recording_count'] for point in progress['series']] == [2]
+
+        async with repository.transaction() as conn:
+            assert await repository.pop_recording(conn, user_id, first) == 'a.wav'
+            assert await repository.pop_recording(conn, user_id, first) is None
+
+        progress = await repository.get_user_progress(user_id)
+        assert progress['recording_count'] == 1
+        assert progress['averages']['coherence'] == pytest.approx(0.4)
+        assert await repository.count_user_recordings(user_id) == 1
+
+    run(database_url, body)
+
+
+def test_progress_of_a_user_without_recordings(database_url, user_id):
+    async def body(repository):
+        progress = await repository.get_user_progress(user_id, bucket='weekly')
+        assert progress['recording_count'] == 0
+        assert progress['averages']['grammar'] is None
+        assert progress['series'] == []
+
+    run(database_url, body)
+
+
+def test_search_only_returns_the_users_recordings(database_url, user_id):
+    other_user = f"{user_id}-other"
+    word = f"zebra{uuid.uuid4().hex[:6]}"
+
+    async def body(repository):
+        own = await save(repository, user_id, 'a.wav', transcription=f"my {word} story")
+        await save(repository, other_user, 'b.wav', transcription=f"their {word} story")
+        await save(repository, user_id, 'c.wav', transcription="nothing to see")
+
+        found = await repository.search_recordings(user_id, word)
+        assert [result['id'] for result in found['results']] == [own]
+        assert '<mark>' in found['results'][0]['snippet']
+        assert not found['has_more']
+
+        assert (await repository.search_recordings(user_id, '   '))['results'] == []
+
+    run(database_url, body)
+
+
+def test_users_and_prompts(database_url, user_id):
+    async def body(repository):
+        assert await repository.create_user(user_id, 'secret')
+        assert not await repository.create_user(user_id, 'again')
+        assert await repository.verify_user(user_id, 'secret')
+        assert not await repository.verify_user(user_id, 'wrong')
+
+        prompts = await repository.list_prompts()
+        assert prompts and 'reference_answer' not in prompts[0]
+        created = await repository.create_prompt('Describe your town', level='A2')
+        assert (await repository.get_prompt(created['id']))['level'] == 'A2'
+
+    run(database_url, body)
+
+
+def test_streamlit_saves_update_the_same_aggregates(tmp_path, user_id):
+    # The synchronous manager writes the aggregates with the same SQL the API reads
+    db_path = tmp_path / 'recordings.db'
+    db_manager = DatabaseManager(str(db_path))
+    db_manager.save_recording(user_id, 'a.wav', grading_result=GRADES)
+    assert db_manager.count_user_recordings(user_id) == 1
+    assert db_manager.delete_recording(user_id, 'missing.wav') is False
+
+    async def body(repository):
+        progress = await repository.get_user_progress(user_id)
+        assert progress['recording_count'] == 1
+        assert progress['averages']['grammar'] == pytest.approx(0.7)
+
+    run(f"sqlite:///{db_path}", body)
+    assert db_manager.delete_recording(user_id, 'a.wav') is True
+    assert db_manager.count_user_recordings(user_id) == 0
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import sqlite3
+import tarfile
+
+import pandas as pd
+import pytest
+from starlette.concurrency import iterate_in_threadpool
+
+from app.database import bulk
+from app.database.db_manager import DatabaseManager
+from app.storage.storage_manager import StorageManager
+
+GRADES = {'coherence': 0.8, 'grammar': 0.7, 'vocabulary': 0.6, 'rubric_version': 2}
+
+
+def make_db(tmp_path, name='recordings.db', filenames=('a.wav', 'b.wav', 'c.wav')):
+    db_manager = DatabaseManager(str(tmp_path / name))
+    for filename in filenames:
+        db_manager.save_recording('alice', filename, transcription=f"about {filename}",
+                                  grading_result=GRADES)
+    return db_manager
+
+
+async def consume(stream):
+    return b''.join([data async for data in iterate_in_threadpool(stream)])
+
+
+def test_streams_survive_switching_threadpool_threads(tmp_path):
+    # StreamingResponse advances sync generators with one threadpool call per chunk
+    db_manager = make_db(tmp_path)
+    storage_manager = StorageManager(tmp_path / 'audio')
+    for filename in ('a.wav', 'b.wav', 'c.wav'):
+        storage_manager.save_recording('alice', b'RIFF' + filename.encode(), filename)
+
+    async def main():
+        return await asyncio.gather(
+            *(consume(bulk.iter_export(db_manager, chunk_size=1)) for _ in range(4)),
+            *(consume(bulk.iter_audio_tar(db_manager, storage_manager)) for _ in range(4)),
+        )
+
+    results = asyncio.run(main())
+    for data in results[:4]:
+        frame = pd.read_csv(io.BytesIO(data))
+        assert list(frame['filename']) == ['a.wav', 'b.wav', 'c.wav']
+    for data in results[4:]:
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            assert tar.getnames() == ['alice/a.wav', 'alice/b.wav', 'alice/c.wav']
+
+
+
+def test_reimport_skips_existing_recordings(tmp_path):
+    source = make_db(tmp_path)
+    path = tmp_path / 'export.csv'
+    assert bulk.export_to_file(source, path) == 3
+
+    target = make_db(tmp_path, 'target.db', filenames=('a.wav',))
+    assert bulk.import_recordings(target, bulk.iter_import_chunks(path, chunk_size=2)) == 2
+    assert bulk.import_recordings(target, bulk.iter_import_chunks(path)) == 0
+
+    c = target.conn.cursor()
+    assert c.execute('SELECT COUNT(*) FROM recordings').fetchone()[0] == 3
+    assert c.execute('SELECT COUNT(*) FROM recording_grades').fetchone()[0] == 3
+    assert target.count_user_recordings('alice') == 3
+
+
+def test_saves_wait_for_a_running_import(tmp_path):
+    source = make_db(tmp_path)
+    path = tmp_path / 'export.csv'
+    bulk.export_to_file(source, path)
+    target = make_db(tmp_path, 'target.db', filenames=())
+    other = sqlite3.connect(target.db_path, timeout=0)
+
+    def chunks():
+        # A save from another process while the first chunk is being read
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            other.execute("INSERT INTO recordings (user_id, filename, timestamp) "
+                          "VALUES ('bob', 'x.wav', CURRENT_TIMESTAMP)")
+        yield from bulk.iter_import_chunks(path)
+
+    assert bulk.import_recordings(target, chunks()) == 3
+    other.close()
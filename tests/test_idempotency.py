@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import idempotency
+from app.api.idempotency import IdempotencyManager
+from app.database.shared_store import AsyncStore, MemoryStore
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(idempotency, 'POLL_INTERVAL_SECONDS', 0.01)
+
+
+@pytest.fixture
+def store():
+    return AsyncStore(MemoryStore())
+
+
+class Pipeline:
+    """Counts its runs; each run waits for release() and returns result"""
+
+    def __init__(self, result='graded', error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.started = asyncio.Event()
+        self.finish = asyncio.Event()
+
+    def release(self):
+        self.finish.set()
+
+    async def __call__(self):
+        self.runs += 1
+        self.started.set()
+        await self.finish.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_duplicates_run_the_pipeline_once(store):
+    async def main():
+        manager = IdempotencyManager(store)
+        pipeline = Pipeline()
+        first = asyncio.create_task(manager.run('alice', 'k', 'fp', pipeline))
+        await pipeline.started.wait()
+        second = asyncio.create_task(manager.run('alice', 'k', 'fp', pipeline))
+        await asyncio.sleep(0)
+        pipeline.release()
+
+        assert await first == ('graded', False)
+        assert await second == ('graded', True)
+        # Later duplicates replay the stored result
+        assert await manager.run('alice', 'k', 'fp', pipeline) == ('graded', True)
+        assert pipeline.runs == 1
+
+    asyncio.run(main())
+
+
+def test_duplicate_on_another_worker_waits_for_the_result(store):
+    async def main():
+        pipeline = Pipeline()
+        first = asyncio.create_task(IdempotencyManager(store).run('alice', 'k', 'fp', pipeline))
+        await pipeline.started.wait()
+        second = asyncio.create_task(IdempotencyManager(store).run('alice', 'k', 'fp', pipeline))
+        await asyncio.sleep(0.05)
+        pipeline.release()
+
+        assert await first == ('graded', False)
+        assert await second == ('graded', True)
+        assert pipeline.runs == 1
+
+    asyncio.run(main())
+
+
+def test_key_reused_for_a_different_request_is_rejected(store):
+    async def main():
+        manager = IdempotencyManager(store)
+        pipeline = Pipeline()
+        pipeline.release()
+        await manager.run('alice', 'k', 'fp', pipeline)
+        with pytest.raises(HTTPException) as error:
+            await manager.run('alice', 'k', 'other', pipeline)
+        assert error.value.status_code == 422
+
+        # Keys are per user
+        assert await manager.run('bob', 'k', 'other', pipeline) == ('graded', False)
+
+    asyncio.run(main())
+
+
+def test_failed_and_unsuccessful_results_release_the_key(store):
+    async def main():
+        manager = IdempotencyManager(store)
+        failing = Pipeline(error=RuntimeError('provider down'))
+        failing.release()
+        with pytest.raises(RuntimeError):
+            await manager.run('alice', 'k', 'fp', failing)
+
+        unsuccessful = Pipeline(result={'error': 'no speech'})
+        unsuccessful.release()
+        succeeded = lambda result: 'error' not in result  # noqa: E731
+        for _ in range(2):
+            result = await manager.run('alice', 'k', 'fp', unsuccessful, succeeded)
+            assert result == ({'error': 'no speech'}, False)
+        assert unsuccessful.runs == 2
+
+        pipeline = Pipeline()
+        pipeline.release()
+        assert await manager.run('alice', 'k', 'fp', pipeline, succeeded) == ('graded', False)
+
+    asyncio.run(main())
+
+
+def test_waiter_on_another_worker_gets_409_when_the_key_is_released(store):
+    async def main():
+        pipeline = Pipeline(error=RuntimeError('provider down'))
+        first = asyncio.create_task(IdempotencyManager(store).run('alice', 'k', 'fp', pipeline))
+        await pipeline.started.wait()
+        second = asyncio.create_task(IdempotencyManager(store).run('alice', 'k', 'fp', pipeline))
+        await asyncio.sleep(0.05)
+        pipeline.release()
+
+        with pytest.raises(RuntimeError):
+            await first
+        with pytest.raises(HTTPException) as error:
+            await second
+        assert error.value.status_code == 409
+        assert error.value.headers == {'Retry-After': '1'}
+
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import rate_limit
+from app.api.rate_limit import Limit, RateLimiter
+from app.database.shared_store import AsyncStore, MemoryStore
+
+LIMITS = {
+    'requests': Limit(2, 60),
+    'audio-seconds': Limit(100, 100),
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(AsyncStore(MemoryStore()), LIMITS)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_requests_refill_evenly(clock, limiter):
+    assert run(limiter.acquire('alice', 'requests')) == (True, 1, 0.0)
+    assert run(limiter.acquire('alice', 'requests')) == (True, 0, 0.0)
+    allowed, tokens, retry_after = run(limiter.acquire('alice', 'requests'))
+    assert not allowed and tokens == 0
+    # One token every 30 seconds
+    assert retry_after == pytest.approx(30)
+
+    clock.now += 15
+    allowed, tokens, retry_after = run(limiter.acquire('alice', 'requests'))
+    assert not allowed
+    assert tokens == pytest.approx(0.5)
+    assert retry_after == pytest.approx(15)
+
+    clock.now += 15
+    assert run(limiter.acquire('alice', 'requests'))[0]
+    # Other users have their own bucket
+    assert run(limiter.acquire('bob', 'requests')) == (True, 1, 0.0)
+
+
+def test_refill_stops_at_capacity(clock, limiter):
+    run(limiter.acquire('alice', 'requests'))
+    clock.now += 3600
+    assert run(limiter.acquire('alice', 'requests')) == (True, 1, 0.0)
+
+
+def test_charges_go_into_debt_and_block_until_repaid(clock, limiter):
+    assert run(limiter.charge('alice', 'audio-seconds', 130)) == -30
+    allowed, tokens, retry_after = run(limiter.ensure_available('alice', 'audio-seconds'))
+    assert not allowed and tokens == -30
+    assert retry_after == pytest.approx(30)
+
+    # Checking availability doesn't charge anything
+    clock.now += 20
+    assert run(limiter.ensure_available('alice', 'audio-seconds'))[1] == pytest.approx(-10)
+    clock.now += 11
+    allowed, tokens, _ = run(limiter.ensure_available('alice', 'audio-seconds'))
+    assert allowed and tokens == pytest.approx(1)
+
+
+def test_enforce_refuses_debt_without_spending_a_request(clock, limiter):
+    run(limiter.charge('alice', 'audio-seconds', 100.5))
+    with pytest.raises(HTTPException) as error:
+        run(limiter.enforce('alice'))
+    assert error.value.status_code == 429
+    assert error.value.detail == "Rate limit exceeded: audio-seconds"
+    # 0.5 seconds of debt at one token per second, rounded up to whole seconds
+    assert error.value.headers['Retry-After'] == '1'
+
+    clock.now += 1
+    remaining = run(limiter.enforce('alice'))
+    assert remaining['requests'] == 1
+    assert remaining['audio-seconds'] == pytest.approx(0.5)
+    assert limiter.headers(remaining) == {
+        'X-RateLimit-Remaining-Requests': '1',
+        'X-RateLimit-Remaining-Audio-Seconds': '0',
+    }
+
+
+def test_enforce_reports_retry_after_for_requests(clock, limiter):
+    run(limiter.enforce('alice'))
+    run(limiter.enforce('alice'))
+    with pytest.raises(HTTPException) as error:
+        run(limiter.enforce('alice'))
+    assert error.value.detail == "Rate limit exceeded: requests"
+    assert error.value.headers['Retry-After'] == '30'
+    assert error.value.headers['X-RateLimit-Remaining-Audio-Seconds'] == '100'
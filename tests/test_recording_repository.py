@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.database.async_repository import create_repository
+from app.database.db_manager import DatabaseManager
+from app.database.recording_repository import RecordingRepository
+from app.storage.storage_manager import StorageManager
+
+GRACE_SECONDS = 60
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / 'recordings.db'
+
+
+@pytest.fixture
+def db_manager(db_path):
+    return DatabaseManager(str(db_path))
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return StorageManager(tmp_path / 'audio')
+
+
+def run(db_path, db_manager, storage, body):
+    async def main():
+        database = create_repository(f"sqlite:///{db_path}", pool_size=2)
+        await database.open()
+        try:
+            return await body(RecordingRepository(db_manager, storage, database), database)
+        finally:
+            await database.close()
+    return asyncio.run(main())
+
+
+def fail_commits(database):
+    """Make the next transaction roll back after its body ran"""
+    transaction = database.transaction
+
+    @asynccontextmanager
+    async def failing_transaction():
+        async with transaction() as conn:
+            yield conn
+            raise sqlite3.OperationalError('disk I/O error')
+
+    database.transaction = failing_transaction
+
+
+def write(storage, user_id, name, age=0):
+    path = storage.get_user_directory(user_id) / name
+    path.write_bytes(b'RIFF')
+    if age:
+        then = time.time() - age
+        os.utime(path, (then, then))
+    return path
+
+
+def test_save_and_delete(db_path, db_manager, storage):
+    async def body(repository, database):
+        recording_id = await repository.save('alice', b'RIFF', 'a.wav')
+        assert storage.get_recording_path('alice', 'a.wav').read_bytes() == b'RIFF'
+        assert await database.get_user_filenames('alice') == {'a.wav'}
+
+        assert await repository.delete('alice', recording_id) == 'a.wav'
+        assert await repository.delete('alice', recording_id) is None
+        assert await database.get_user_filenames('alice') == set()
+
+    run(db_path, db_manager, storage, body)
+    assert list(storage.iter_user_files()) == []
+
+
+def test_failed_save_leaves_no_file_or_row(db_path, db_manager, storage):
+    async def body(repository, database):
+        fail_commits(database)
+        with pytest.raises(sqlite3.OperationalError):
+            await repository.save('alice', b'RIFF', 'a.wav')
+        assert await database.get_user_filenames('alice') == set()
+
+    run(db_path, db_manager, storage, body)
+    assert list(storage.iter_user_files()) == []
+
+
+def test_failed_delete_restores_the_file(db_path, db_manager, storage):
+    async def body(repository, database):
+        recording_id = await repository.save('alice', b'RIFF', 'a.wav')
+        fail_commits(database)
+        with pytest.raises(sqlite3.OperationalError):
+            await repository.delete('alice', recording_id)
+        assert await database.get_user_filenames('alice') == {'a.wav'}
+
+    run(db_path, db_manager, storage, body)
+    assert [path.name for _, path in storage.iter_user_files()] == ['a.wav']
+
+
+def test_reconcile_repairs_old_leftovers_only(db_manager, storage):
+    old = GRACE_SECONDS * 2
+    for filename in ('kept.wav', 'undeleted.wav', 'missing.wav'):
+        db_manager.save_recording('alice', filename)
+    write(storage, 'alice', 'kept.wav', age=old)
+    write(storage, 'alice', 'undeleted.wav.deleted', age=old)
+    write(storage, 'alice', 'gone.wav.deleted', age=old)
+    write(storage, 'alice', 'orphan.wav', age=old)
+    write(storage, 'alice', 'new-orphan.wav')
+    write(storage, 'alice', 'crashed.wav.partial', age=old)
+    write(storage, 'alice', 'saving.wav.partial')
+
+    repository = RecordingRepository(db_manager, storage)
+    stats = repository.reconcile(grace_seconds=GRACE_SECONDS)
+
+    assert stats == {'partials': 1, 'restored': 1, 'tombstones': 1, 'orphans': 1, 'dangling': 1}
+    assert sorted(path.name for _, path in storage.iter_user_files()) == [
+        'kept.wav', 'new-orphan.wav', 'saving.wav.partial', 'undeleted.wav'
+    ]
+    assert db_manager.get_user_filenames('alice') == {'kept.wav', 'undeleted.wav', 'missing.wav'}
+
+    # Rows without a file are only removed when asked to
+    stats = repository.reconcile(grace_seconds=GRACE_SECONDS, remove_dangling_rows=True)
+    assert stats['dangling'] == 1
+    assert db_manager.get_user_filenames('alice') == {'kept.wav', 'undeleted.wav'}
+
+
+def test_reconcile_leaves_a_recent_tombstone_alone(db_manager, storage):
+    db_manager.save_recording('alice', 'a.wav')
+    write(storage, 'alice', 'a.wav.deleted')
+
+    stats = RecordingRepository(db_manager, storage).reconcile(grace_seconds=GRACE_SECONDS)
+    assert stats['restored'] == 0
+    assert [path.name for _, path in storage.iter_user_files()] == ['a.wav.deleted']
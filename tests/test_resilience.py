@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from app.model.resilience import (
+    CircuitBreaker, CircuitOpenError, Deadline, ResilientCaller, hedge_percentile_from_env
+)
+
+
+def open_breaker(**kwargs):
+    breaker = CircuitBreaker('test', failure_threshold=2, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    return breaker
+
+
+def test_breaker_half_open_probe_closes_circuit():
+    breaker = open_breaker(reset_timeout=0.1)
+
+    # Not enough time left to wait for the reset timeout: fail fast
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(Deadline(0.05))
+
+    # Waits out the reset timeout, then runs as the single half-open probe
+    started = time.monotonic()
+    breaker.before_call(Deadline(1))
+    assert time.monotonic() - started >= 0.05
+    assert breaker.state == 'half-open'
+
+    # Others wait for the probe's outcome instead of calling the provider too
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(Deadline(0.05))
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call(Deadline(0.01))
+
+
+def test_breaker_failed_probe_reopens_circuit():
+    breaker = open_breaker(reset_timeout=0.05)
+    breaker.before_call(Deadline(1))
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(Deadline(0.01))
+
+
+def test_breaker_refuses_callers_beyond_max_queued():
+    breaker = open_breaker(reset_timeout=0.3, max_queued=1)
+    queued = threading.Thread(target=breaker.before_call, args=(Deadline(2),))
+    queued.start()
+    while breaker.waiting < 1:
+        time.sleep(0.005)
+
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(Deadline(2))
+    assert time.monotonic() - started < 0.1
+
+    queued.join()
+    assert breaker.state == 'half-open'
+
+
+def test_slow_call_is_hedged_after_p95_latency():
+    caller = ResilientCaller('test', call_timeout=2, max_retries=0, hedge_percentile=0.95)
+    for _ in range(20):
+        caller.latency.record(0.05)
+    calls = []
+
+    def provider():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(1)
+            return 'slow'
+        return 'hedged'
+
+    started = time.monotonic()
+    assert caller.call(provider) == 'hedged'
+    assert len(calls) == 2
+    assert calls[1] - started >= 0.05
+    assert time.monotonic() - started < 0.5
+
+
+def test_no_hedging_without_enough_latency_samples():
+    caller = ResilientCaller('test', call_timeout=2, max_retries=0, hedge_percentile=0.95)
+    calls = []
+
+    def provider():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'ok'
+
+    assert caller.call(provider) == 'ok'
+    assert len(calls) == 1
+
+
+def test_hedging_is_off_without_a_percentile(monkeypatch):
+    monkeypatch.delenv('SPEECH_HEDGE_PERCENTILE', raising=False)
+    caller = ResilientCaller('test', call_timeout=2, max_retries=0,
+                             hedge_percentile=hedge_percentile_from_env('SPEECH_HEDGE_PERCENTILE'))
+    for _ in range(20):
+        caller.latency.record(0.01)
+    calls = []
+
+    def provider():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'ok'
+
+    assert caller.call(provider) == 'ok'
+    assert len(calls) == 1
+
+    monkeypatch.setenv('SPEECH_HEDGE_PERCENTILE', '0.9')
+    assert hedge_percentile_from_env('SPEECH_HEDGE_PERCENTILE') == 0.9
+
+
+def test_retries_stop_at_the_deadline():
+    caller = ResilientCaller('test', call_timeout=1, max_retries=10, backoff_base=0.2,
+                             breaker=CircuitBreaker('test', failure_threshold=100))
+    calls = []
+
+    def provider():
+        calls.append(1)
+        raise google_exceptions.ServiceUnavailable('down')
+
+    started = time.monotonic()
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        caller.call(provider, deadline=Deadline(0.5))
+    assert time.monotonic() - started < 0.5
+    assert 1 < len(calls) < 10
+
+
+def test_non_transient_errors_are_not_retried():
+    caller = ResilientCaller('test', call_timeout=1)
+    calls = []
+
+    def provider():
+        calls.append(1)
+        raise ValueError('bad request')
+
+    with pytest.raises(ValueError):
+        caller.call(provider)
+    assert len(calls) == 1
+    assert caller.breaker.failures == 0
+
+
+def test_hung_calls_are_capped_per_provider():
+    release = threading.Event()
+    caller = ResilientCaller('test', call_timeout=0.1, max_retries=0, max_in_flight=1)
+    calls = []
+
+    def provider():
+        calls.append(1)
+        release.wait(5)
+        return 'ok'
+
+    with pytest.raises(TimeoutError):
+        caller.call(provider)
+
+    # The abandoned call still holds the only slot, so the provider isn't called again
+    with pytest.raises(TimeoutError, match='too many calls'):
+        caller.call(provider)
+    assert len(calls) == 1
+
+    # Once it returns, a new call gets the slot within its timeout
+    release.set()
+    assert caller.call(provider) == 'ok'